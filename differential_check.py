@@ -0,0 +1,21 @@
+"""
+This script runs the differential harness (see modules/differential.py): every registered engine
+(faster or alternative implementations of operation_count, f_measure, variations, ...) is run on
+randomised, adversarial beat sequences, and its results must be exactly equal to the ones of the
+frozen reference implementations (modules/reference.py).
+It prints, per engine, the number of cases checked and mismatching, and the timing ratio (speedup),
+and exits with an error on any mismatch.
+"""
+
+import argparse
+
+from modules.differential import ENGINES, check
+
+parser = argparse.ArgumentParser(description='Checks the alternative engines against the reference implementations.')
+parser.add_argument('-n', '--n_cases', type=int, default=500, help='number of random cases')
+parser.add_argument('-s', '--seed', type=int, default=0, help='seed of the random cases')
+parser.add_argument('-e', '--engines', nargs='+', choices=list(ENGINES), help='engines to check (default: all)')
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    check(args.n_cases, args.seed, args.engines)
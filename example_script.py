@@ -14,7 +14,7 @@ import matplotlib.pyplot as plt
 
 import numpy as np
 
-from modules.ext_libraries import f_measure, variations
+from modules.ext_libraries import f_measure, f_measure_from_counts, variations
 
 from modules.operating import operation_count, process_operations, get_summary
 from modules.plotting import plot_operations
@@ -40,14 +40,14 @@ for dets_variation, type_variation in zip(dets_variations, types_variations):
     # Get matrix of operations and annotation efficiency
     ops, ann_eff = operation_count(dets_variation, anns)
 
-    # Get list of transformed detections
-    transformed = process_operations(ops)
+    # Get list of transformed detections, with their F-measure counts (derived from the operations)
+    transformed, transformed_counts, _ = process_operations(ops, anns, return_stats=True)
 
     # Save list of transformed detections
     np.savetxt(f'dets_{type_variation}_transformed.txt', transformed, fmt='%.2f')
 
     # Get combined f-measure (tuple with initial f-measure and transformed f-measure)
-    comb_f_measure = f_measure(dets_variation, anns), f_measure(transformed, anns)
+    comb_f_measure = f_measure(dets_variation, anns), f_measure_from_counts(*transformed_counts)
 
     # Display results
     print(get_summary(type_variation, ann_eff, comb_f_measure))
@@ -0,0 +1,39 @@
+"""
+This script benchmarks the import (cold start) time of the package entry points.
+Each import is timed in a fresh interpreter, and the median over several runs is reported,
+both for the NumPy only core (what metric-only worker processes need) and for the plotting layer.
+"""
+
+import statistics
+import subprocess
+import sys
+
+N_RUNS = 10
+
+STATEMENTS = [
+    ('numpy (reference)', 'import numpy'),
+    ('core: modules', 'import modules'),
+    ('core: modules.operating', 'import modules.operating'),
+    ('core: modules.ext_libraries', 'import modules.ext_libraries'),
+    ('plotting: modules.plotting', 'import modules.plotting'),
+    ('plotting: modules.plot_operations', 'import modules; modules.plot_operations'),
+]
+
+TIMER = 'import time; t0 = time.perf_counter(); {stmt}; print(time.perf_counter() - t0)'
+
+
+def time_import(stmt, n_runs=N_RUNS):
+    """Median time (in seconds) to run the statement in a fresh interpreter."""
+    times = []
+    for _ in range(n_runs):
+        out = subprocess.run([sys.executable, '-c', TIMER.format(stmt=stmt)],
+                             check=True, capture_output=True, text=True).stdout
+        times.append(float(out))
+    return statistics.median(times)
+
+
+if __name__ == '__main__':
+    print(f'median import time over {N_RUNS} fresh interpreters')
+    print('- - - - - - - - - - - - - - - - - - - - - - - - - - -')
+    for label, stmt in STATEMENTS:
+        print(f'{label:35s} {1000 * time_import(stmt):8.1f} ms')
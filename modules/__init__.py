@@ -0,0 +1,32 @@
+"""
+Shift if you can: counting and visualising correction operations for beat tracking evaluation.
+
+The core of the package (operations, metrics and variations) only depends on NumPy.
+The plotting layer (matplotlib) is loaded lazily, the first time one of its names is accessed,
+so metric-only processes don't pay for its import.
+
+"""
+import importlib
+
+from modules.bootstrap import bootstrap_ci, dataset_statistics, paired_permutation_test, track_statistics
+from modules.compact import (annotation_efficiency_compact, expand_operations, operation_count_compact,
+                             process_operations_compact, quantise)
+from modules.export import export_svg, export_tiles, to_svg
+from modules.ext_libraries import (evaluate, f_measure, f_measure_counts, f_measure_from_counts, register_metric,
+                                   variations)
+from modules.operating import (BeatMatching, annotation_efficiency, get_summary, get_variation,
+                               local_annotation_efficiency, operation_count, process_operations)
+from modules.session import CorrectionSession
+
+# names provided by the plotting layer: name -> module
+_LAZY_NAMES = {
+    'plot_operations': 'modules.plotting',
+    'OperationsView': 'modules.plotting',
+}
+
+
+def __getattr__(name):
+    """Imports the plotting layer on first access (PEP 562)."""
+    if name in _LAZY_NAMES:
+        return getattr(importlib.import_module(_LAZY_NAMES[name]), name)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -0,0 +1,227 @@
+"""
+This module contains the dataset-level statistics: bootstrap confidence intervals and
+paired (tracker comparison) permutation tests for annotation efficiency and F-measure.
+
+The per-track sufficient statistics (operation counts and F-measure hits/fp/fn) are computed
+once, and the resampling is done on them, vectorised (as weight matrices) and in parallel.
+
+"""
+import numpy as np
+
+from modules.ext_libraries import f_measure_counts
+from modules.operating import annotation_efficiency, operation_count
+
+# Columns of the sufficient statistics
+STAT_NAMES = ('good', 'insertions', 'deletions', 'shifts', 'hits', 'fp', 'fn')
+GOOD, INSERTIONS, DELETIONS, SHIFTS, HITS, FP, FN = range(len(STAT_NAMES))
+
+METRICS = ('annotation_efficiency', 'f_measure')
+
+# Number of resamples drawn (as one weight matrix) per task
+CHUNK_SIZE = 1000
+
+
+def track_statistics(detections, annotations, inn_tol_win=0.07, out_tol_win=1.0):
+    """
+    Computes the sufficient statistics of a track.
+
+    Parameters
+    ----------
+    detections : nparray
+        beat detections.
+    annotations : nparray
+        ground-truth annotations.
+    inn_tol_win : float
+        inner tolerance window in seconds
+        (default value=0.07)
+    out_tol_win : float
+        outer tolerance window in seconds
+        (default value=1)
+
+    Returns
+    -------
+    stats: nparray
+        counts of good detections, insertions, deletions, shifts (see annotation_efficiency)
+        and of hits, false positives and false negatives (see f_measure_counts).
+    """
+    detections, annotations = np.asarray(detections, dtype=float), np.asarray(annotations, dtype=float)
+    stats = np.zeros(len(STAT_NAMES))
+
+    if detections.size == 0:
+        # every annotation is an insertion
+        stats[INSERTIONS] = annotations.size
+    elif annotations.size == 0:
+        # every detection is a deletion
+        stats[DELETIONS] = detections.size
+    else:
+        operations, _ = operation_count(detections, annotations, inn_tol_win, out_tol_win)
+        stats[GOOD:SHIFTS + 1] = annotation_efficiency(operations)[1:]
+    stats[HITS:] = f_measure_counts(annotations, detections, inn_tol_win)
+
+    return stats
+
+
+def dataset_statistics(tracks, inn_tol_win=0.07, out_tol_win=1.0):
+    """
+    Computes the sufficient statistics of a dataset.
+
+    Parameters
+    ----------
+    tracks : list
+        list of (detections, annotations) tuples.
+
+    Returns
+    -------
+    stats: nparray
+        matrix of sufficient statistics (one row per track, see track_statistics).
+    """
+    return np.array([track_statistics(detections, annotations, inn_tol_win, out_tol_win)
+                     for detections, annotations in tracks]).reshape(-1, len(STAT_NAMES))
+
+
+def metric_from_statistics(stats, metric='annotation_efficiency'):
+    """
+    Calculates a metric from (any array of) sufficient statistics, along the last axis.
+
+    Tracks without operations have an annotation efficiency of 1 (as in operation_count),
+    and an F-measure of 0 if there are no hits (as in f_measure).
+    """
+    stats = np.asarray(stats, dtype=float)
+    if metric == 'annotation_efficiency':
+        good = stats[..., GOOD]
+        total = stats[..., GOOD:SHIFTS + 1].sum(axis=-1)
+        return np.divide(good, total, out=np.ones_like(good), where=total > 0)
+    if metric == 'f_measure':
+        hits = stats[..., HITS]
+        p = np.divide(hits, hits + stats[..., FP], out=np.zeros_like(hits), where=(hits + stats[..., FP]) > 0)
+        r = np.divide(hits, hits + stats[..., FN], out=np.zeros_like(hits), where=(hits + stats[..., FN]) > 0)
+        return np.divide(2 * p * r, p + r, out=np.zeros_like(hits), where=(p + r) > 0)
+    raise ValueError(f'unknown metric {metric!r}, expected one of {METRICS}')
+
+
+def _dataset_metric(weights, stats, metric, statistic):
+    """Dataset metric for each row of (resampling) weights over the tracks."""
+    if statistic == 'mean':
+        return weights @ metric_from_statistics(stats, metric) / weights.sum(axis=1)
+    if statistic == 'pooled':
+        return metric_from_statistics(weights @ stats, metric)
+    raise ValueError(f"unknown statistic {statistic!r}, expected 'mean' or 'pooled'")
+
+
+def _run_chunks(task, n_resamples, seed, n_jobs):
+    """Runs task(rng, size) over chunks of the resamples (in parallel threads) and concatenates the results."""
+    # (imported here: concurrent.futures isn't loaded by the core import)
+    from concurrent.futures import ThreadPoolExecutor
+
+    sizes = [CHUNK_SIZE] * (n_resamples // CHUNK_SIZE)
+    if n_resamples % CHUNK_SIZE:
+        sizes.append(n_resamples % CHUNK_SIZE)
+    # one independent stream per chunk: results don't depend on n_jobs
+    rngs = [np.random.default_rng(s) for s in np.random.SeedSequence(seed).spawn(len(sizes))]
+
+    with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+        results = list(executor.map(task, rngs, sizes))
+
+    return np.concatenate(results)
+
+
+def bootstrap_ci(stats, metric='annotation_efficiency', statistic='mean', n_resamples=10000, confidence=0.95,
+                 seed=None, n_jobs=None):
+    """
+    Bootstrap (percentile) confidence interval of a dataset metric, resampling tracks.
+
+    Parameters
+    ----------
+    stats : nparray
+        matrix of sufficient statistics (see dataset_statistics).
+    metric : str
+        'annotation_efficiency' or 'f_measure'
+        (default value='annotation_efficiency')
+    statistic : str
+        'mean': mean of the per-track metric
+        'pooled': metric of the summed counts
+        (default value='mean')
+    n_resamples : int
+        number of bootstrap resamples
+        (default value=10000)
+    confidence : float
+        confidence level
+        (default value=0.95)
+    seed : int
+        seed of the random generator
+        (default value=None)
+    n_jobs : int
+        number of parallel threads (None: as many as CPUs)
+        (default value=None)
+
+    Returns
+    -------
+    value: float
+        dataset metric.
+    low: float
+        lower bound of the confidence interval.
+    high: float
+        upper bound of the confidence interval.
+    """
+    stats = np.asarray(stats, dtype=float)
+    n_tracks = len(stats)
+
+    def task(rng, size):
+        weights = rng.multinomial(n_tracks, np.full(n_tracks, 1 / n_tracks), size=size)
+        return _dataset_metric(weights, stats, metric, statistic)
+
+    resampled = _run_chunks(task, n_resamples, seed, n_jobs)
+    value = _dataset_metric(np.ones((1, n_tracks)), stats, metric, statistic)[0]
+    low, high = np.percentile(resampled, [50 * (1 - confidence), 50 * (1 + confidence)])
+
+    return value, low, high
+
+
+def paired_permutation_test(stats_a, stats_b, metric='annotation_efficiency', statistic='mean', n_resamples=10000,
+                            seed=None, n_jobs=None):
+    """
+    Paired permutation test of the difference of a dataset metric between two trackers,
+    randomly swapping the trackers' results on each track.
+
+    Parameters
+    ----------
+    stats_a : nparray
+        matrix of sufficient statistics of tracker A (see dataset_statistics).
+    stats_b : nparray
+        matrix of sufficient statistics of tracker B (same tracks, in the same order).
+    metric, statistic, n_resamples, seed, n_jobs:
+        see bootstrap_ci.
+
+    Returns
+    -------
+    difference: float
+        difference of the dataset metric (A - B).
+    p_value: float
+        two-sided p-value.
+    """
+    stats_a = np.asarray(stats_a, dtype=float)
+    stats_b = np.asarray(stats_b, dtype=float)
+    n_tracks = len(stats_a)
+
+    if statistic not in ('mean', 'pooled'):
+        raise ValueError(f"unknown statistic {statistic!r}, expected 'mean' or 'pooled'")
+    values_a = metric_from_statistics(stats_a, metric)
+    values_b = metric_from_statistics(stats_b, metric)
+
+    def difference(swaps):
+        keeps = 1 - swaps
+        if statistic == 'mean':
+            return (keeps - swaps) @ (values_a - values_b) / n_tracks
+        return (metric_from_statistics(keeps @ stats_a + swaps @ stats_b, metric) -
+                metric_from_statistics(swaps @ stats_a + keeps @ stats_b, metric))
+
+    def task(rng, size):
+        return difference(rng.integers(0, 2, size=(size, n_tracks)).astype(float))
+
+    observed = difference(np.zeros((1, n_tracks)))[0]
+    permuted = _run_chunks(task, n_resamples, seed, n_jobs)
+    # relative tolerance, so that permutations equivalent to the observed one aren't lost to rounding
+    extreme = np.count_nonzero(np.abs(permuted) >= np.abs(observed) * (1 - 1e-9))
+    p_value = (extreme + 1) / (n_resamples + 1)
+
+    return observed, p_value
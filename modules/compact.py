@@ -0,0 +1,200 @@
+"""
+This module contains the compact (integer) operations accounting, for huge corpora.
+
+Times are quantised to integer multiples of a resolution (e.g. milliseconds or microseconds)
+and the operations are stored in a structured array with an integer time, an uint8 bitfield
+of flags and an integer shift: 7 bytes per row for milliseconds, 9 for microseconds (13 for tracks
+longer than ~35 minutes), instead of 40 for the float64 matrix.
+
+Ties are resolved deterministically as the limit of the TIE_OFFSET used in operation_count
+(i.e. each detection is taken to lie infinitesimally after its quantised time), so for
+detections and annotations on the resolution grid all counts are the same as operation_count's.
+
+"""
+import numpy as np
+
+# Flags bitfield (same order as the columns of the operations matrix)
+GOOD = 1
+INSERTION = 2
+DELETION = 4
+SHIFT = 8
+
+
+def _int_dtype(values, dtypes=(np.int16, np.int32, np.int64)):
+    """Smallest of the (signed) integer types holding the values."""
+    limit = np.max(np.abs(np.asarray(values, dtype=np.int64)), initial=0)
+    for dtype in dtypes:
+        if limit <= np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+
+def quantise(times, resolution=1e-3):
+    """
+    Quantises times to integer multiples of the resolution.
+
+    Parameters
+    ----------
+    times : list/nparray
+        times in seconds.
+    resolution : float
+        resolution in seconds (e.g. 1e-3 for milliseconds, 1e-6 for microseconds)
+        (default value=1e-3)
+
+    Returns
+    -------
+    quantised: nparray
+        integer times (int32 if possible, otherwise int64)
+    """
+    quantised = np.rint(np.asarray(times, dtype=float) / resolution).astype(np.int64)
+    return quantised.astype(_int_dtype(quantised, dtypes=(np.int32, np.int64)))
+
+
+def operation_count_compact(detections=None, annotations=None, inn_tol_win=0.07, out_tol_win=1.0, resolution=1e-3):
+    """
+    Counts the number of operations necessary to maximise the F-measure (see operation_count),
+    on times quantised to the given resolution.
+
+    Parameters
+    ----------
+    detections : list/nparray
+        list of detections (in seconds).
+    annotations : list/nparray
+        list of annotations (in seconds).
+    inn_tol_win : float
+        inner tolerance window in seconds
+        (default value=0.07)
+    out_tol_win : float
+        outer tolerance window in seconds
+        (default value=1)
+    resolution : float
+        resolution in seconds
+        (default value=1e-3)
+
+    Returns
+    -------
+    operations: structured nparray
+        compact operations, with fields 'time', 'flags' (bitfield of GOOD, INSERTION, DELETION and SHIFT)
+        and 'shift' (all times in multiples of the resolution).
+    ae: tuple
+        annotation efficiency and stats (see annotation_efficiency).
+    """
+    detections = np.sort(quantise(detections, resolution))
+    annotations = np.sort(quantise(annotations, resolution))
+    inn = int(round(inn_tol_win / resolution))
+    out = int(round(out_tol_win / resolution))
+
+    accounted = np.zeros(len(detections), dtype=np.int8)  # mark already used detections
+
+    # (1) The closest detection to each annotation (preferring the one before it on ties), if inside the window
+    good_of = np.full(len(annotations), -1)
+    if len(detections) > 0:
+        pos = np.searchsorted(detections, annotations)
+        before = np.maximum(pos - 1, 0)
+        after = np.minimum(pos, len(detections) - 1)
+        no_detection = np.iinfo(np.int64).max
+        dist_before = np.where(pos > 0, annotations - detections[before].astype(np.int64), no_detection)
+        dist_after = np.where(pos < len(detections), detections[after] - annotations.astype(np.int64), no_detection)
+        closest = np.where(dist_before <= dist_after, before, after)
+        # first of any repeated detections
+        closest = np.searchsorted(detections, detections[closest])
+        # a detection at exactly +inn is (infinitesimally) outside the window
+        inside = np.where(dist_before <= dist_after, dist_before <= inn, dist_after < inn)
+        good_of[inside] = closest[inside]
+        accounted[good_of[inside]] = 1
+
+    # (3) Shift the closest unaccounted detection (inside the outer window) to each unaccounted annotation
+    shift_of = np.full(len(annotations), -1)
+    for i in np.nonzero(good_of < 0)[0]:
+        ann = annotations[i]
+        lo = np.searchsorted(detections, ann - out, 'left')
+        hi = np.searchsorted(detections, ann + out, 'left')
+        candidates = lo + np.nonzero(accounted[lo:hi] == 0)[0]
+        if candidates.size > 0:
+            dist = ann - detections[candidates].astype(np.int64)
+            # detections before the annotation win ties
+            idx_closest = candidates[np.argmin(2 * np.abs(dist) + (dist <= 0))]
+            shift_of[i] = idx_closest
+            accounted[idx_closest] = 1
+
+    # (5) Unaccounted annotations become insertions
+    shifted = shift_of >= 0
+    insertions = annotations[(good_of < 0) & ~shifted]
+
+    n_detections = len(detections)
+    operations = np.zeros(n_detections + len(insertions), dtype=[
+        ('time', np.result_type(detections, annotations)),
+        ('flags', np.uint8),
+        ('shift', _int_dtype([out]))])
+    operations['time'][:n_detections] = detections
+    operations['time'][n_detections:] = insertions
+
+    flags = np.full(n_detections, DELETION, dtype=np.uint8)
+    flags[accounted == 1] = SHIFT
+    flags[good_of[good_of >= 0]] = GOOD
+    operations['flags'][:n_detections] = flags
+    operations['flags'][n_detections:] = INSERTION
+    operations['shift'][shift_of[shifted]] = annotations[shifted] - detections[shift_of[shifted]]
+
+    ae = annotation_efficiency_compact(operations)
+
+    return operations, ae
+
+
+def annotation_efficiency_compact(operations=None):
+    """
+    Calculates the annotation efficiency and stats from compact operations (see annotation_efficiency).
+
+    Parameters
+    ----------
+    operations : structured nparray
+        compact operations.
+
+    Returns
+    -------
+    ae: float
+        annotation efficiency (1 if there are no operations, as in operation_count)
+    n_detections: int
+        number of (correct) detections
+    n_insertions: int
+        number of (correct) insertions
+    n_deletions: int
+        number of (correct) deletions
+    n_shifts: int
+        number of (correct) shifts
+
+    """
+    flags = operations['flags']
+    n_detections = np.count_nonzero(flags & GOOD)
+    n_insertions = np.count_nonzero(flags & INSERTION)
+    n_deletions = np.count_nonzero(flags & DELETION)
+    n_shifts = np.count_nonzero(flags & SHIFT)
+    n_operations = n_detections + n_insertions + n_deletions + n_shifts
+    # nothing to operate on (both the detections and annotations are empty): job done, as in operation_count
+    ae = n_detections / n_operations if n_operations > 0 else 1
+
+    return ae, n_detections, n_insertions, n_deletions, n_shifts
+
+
+def process_operations_compact(operations=None):
+    """ returns the transformed detections (in multiples of the resolution) """
+    ops = operations[(operations['flags'] & DELETION) == 0]
+    transformed = np.sort(ops['time'] + ops['shift'])
+
+    return transformed
+
+
+def expand_operations(operations=None, resolution=1e-3):
+    """
+    Expands compact operations into the (float) matrix of operations returned by operation_count
+    (e.g. for plotting). Times are the quantised ones, i.e. without the TIE_OFFSET.
+    """
+    flags = operations['flags']
+    expanded = np.zeros(shape=(len(operations), 5))
+    expanded[:, 0] = operations['time'] * resolution
+    expanded[:, 1] = (flags & GOOD) > 0
+    expanded[:, 2] = (flags & INSERTION) > 0
+    expanded[:, 3] = (flags & DELETION) > 0
+    expanded[:, 4] = operations['shift'] * resolution
+
+    return expanded
@@ -0,0 +1,362 @@
+"""
+This module contains the differential harness, which checks alternative (faster) engines
+against the frozen reference implementations (see modules.reference).
+
+The engines are run on randomised, adversarial beat sequences (ties, duplicates, empty inputs,
+dense clusters, ...), their results must be exactly equal to the reference ones, and the
+timing ratios are reported alongside.
+
+"""
+import contextlib
+import io
+import time
+
+import numpy as np
+
+from modules import reference
+from modules.compact import expand_operations, operation_count_compact, quantise
+from modules.ext_libraries import evaluate, f_measure, f_measure_from_counts, variations
+from modules.operating import TIE_OFFSET, operation_count, process_operations
+from modules.session import CorrectionSession
+
+# Tolerance windows (inner, outer) the cases are drawn with
+TOLERANCES = [(0.07, 1.0), (0.05, 3.0), (0.1, 0.5)]
+
+# Resolution the compact engine is checked at
+COMPACT_RESOLUTION = 1e-3
+
+# Metrics of the registry checked against their reference versions (in this order)
+REGISTRY_METRICS = ['cmlc', 'cmlt', 'amlc', 'amlt', 'p_score', 'cemgil']
+
+# Registered engines: name -> dict(reference, candidate, compare, prepare)
+ENGINES = {}
+
+
+def _beats(rng, n, period=0.5, jitter=0.0, start=0.0):
+    """A (jittered) regular beat sequence."""
+    return start + period * np.arange(n) + rng.normal(0, jitter, n)
+
+
+def gen_random(rng, inn_tol_win, out_tol_win):
+    """Uniformly random detections and annotations."""
+    annotations = np.sort(rng.uniform(0, 30, rng.integers(1, 60)))
+    detections = rng.uniform(0, 30, rng.integers(1, 60))
+    return detections, annotations
+
+
+def gen_tempo(rng, inn_tol_win, out_tol_win):
+    """Jittered beats against a metrical variation (offbeat, double, half, ...) of the annotations."""
+    annotations = np.sort(_beats(rng, rng.integers(2, 80), rng.uniform(0.3, 1.0), 0.01, rng.uniform(0, 2)))
+    sequences, _ = variations(annotations)
+    detections = np.asarray(sequences[rng.integers(len(sequences))], dtype=float)
+    detections = detections + rng.normal(0, 2 * inn_tol_win, detections.size)
+    return detections, annotations
+
+
+def gen_ties(rng, inn_tol_win, out_tol_win):
+    """Detections exactly at the annotations, at their tolerance window bounds, or midway between them."""
+    period = rng.choice([0.5, 2 * inn_tol_win, 2 * out_tol_win, 1.0])
+    annotations = np.round(_beats(rng, rng.integers(2, 40), period, start=1.0), 6)
+    offsets = np.array([0, inn_tol_win, -inn_tol_win, out_tol_win, -out_tol_win, period / 2, -period / 2])
+    n_detections = rng.integers(1, 60)
+    detections = rng.choice(annotations, n_detections) + rng.choice(offsets, n_detections)
+    return detections, annotations
+
+
+def gen_duplicates(rng, inn_tol_win, out_tol_win):
+    """Repeated detections and annotations."""
+    annotations = np.sort(np.repeat(_beats(rng, rng.integers(1, 30), 0.5, 0.02), rng.integers(1, 3)))
+    detections = np.repeat(annotations[rng.integers(0, annotations.size, rng.integers(1, 30))], rng.integers(1, 4))
+    detections = detections + rng.choice([0, inn_tol_win / 2, out_tol_win / 2], detections.size)
+    return detections, annotations
+
+
+def gen_empty(rng, inn_tol_win, out_tol_win):
+    """Empty detections and/or annotations."""
+    beats = _beats(rng, rng.integers(1, 20), 0.5, 0.02)
+    return [(np.array([]), np.array([])), (beats, np.array([])), (np.array([]), beats)][rng.integers(3)]
+
+
+def gen_short(rng, inn_tol_win, out_tol_win):
+    """At most three detections and annotations (e.g. empty third tempo variations of the annotations)."""
+    annotations = _beats(rng, rng.integers(0, 4), 0.5, 0.02, 1.0)
+    detections = _beats(rng, rng.integers(0, 4), 0.5, 2 * inn_tol_win, 1.0)
+    return detections, annotations
+
+
+def gen_dense(rng, inn_tol_win, out_tol_win):
+    """Dense clusters of detections (and annotations) inside the tolerance windows."""
+    centres = rng.uniform(0, 20, rng.integers(1, 10))
+    annotations = np.sort(np.concatenate([c + rng.uniform(-inn_tol_win, inn_tol_win, rng.integers(1, 4))
+                                          for c in centres]))
+    detections = np.concatenate([c + rng.uniform(-2 * inn_tol_win, 2 * inn_tol_win, rng.integers(1, 12))
+                                 for c in centres])
+    return detections, annotations
+
+
+GENERATORS = {
+    'random': gen_random,
+    'tempo': gen_tempo,
+    'ties': gen_ties,
+    'duplicates': gen_duplicates,
+    'empty': gen_empty,
+    'short': gen_short,
+    'dense': gen_dense,
+}
+
+
+def register_engine(name, reference_fn, candidate_fn, compare=None, prepare=None):
+    """
+    Registers an alternative engine, to be checked against a reference.
+
+    Parameters
+    ----------
+    name : str
+        name of the engine (in the report).
+    reference_fn : function
+        reference(case), with case a dict of 'detections', 'annotations', 'inn_tol_win' and 'out_tol_win'.
+    candidate_fn : function
+        candidate(case), whose result must be equal to the reference one.
+    compare : function (optional)
+        compare(reference_result, candidate_result) -> bool
+        (Default value = exact equality)
+    prepare : function (optional)
+        prepare(case) -> case, or None if the engine doesn't apply to the case
+        (Default value = None)
+    """
+    ENGINES[name] = dict(reference=reference_fn, candidate=candidate_fn, compare=compare or exactly_equal,
+                         prepare=prepare)
+
+
+def exactly_equal(result_a, result_b):
+    """Exact (recursive) equality of results: arrays must have the same shape and values."""
+    if isinstance(result_a, (tuple, list)) and isinstance(result_b, (tuple, list)):
+        return len(result_a) == len(result_b) and all(exactly_equal(a, b) for a, b in zip(result_a, result_b))
+    if isinstance(result_a, (np.ndarray, list)) or isinstance(result_b, (np.ndarray, list)):
+        return np.array_equal(result_a, result_b)
+    return result_a == result_b
+
+
+def make_cases(n_cases=500, seed=0):
+    """Draws the cases, cycling through the generators and the tolerance windows."""
+    rng = np.random.default_rng(seed)
+    cases = []
+    for i in range(n_cases):
+        name = list(GENERATORS)[i % len(GENERATORS)]
+        inn_tol_win, out_tol_win = TOLERANCES[(i // len(GENERATORS)) % len(TOLERANCES)]
+        detections, annotations = GENERATORS[name](rng, inn_tol_win, out_tol_win)
+        cases.append(dict(generator=name, detections=np.asarray(detections, dtype=float),
+                          annotations=np.sort(np.asarray(annotations, dtype=float)),
+                          inn_tol_win=inn_tol_win, out_tol_win=out_tol_win))
+    return cases
+
+
+def _timed(function, case):
+    """Result and run time of function(case), with its prints (and 0/0 warnings) silenced."""
+    with contextlib.redirect_stdout(io.StringIO()), np.errstate(invalid='ignore'):
+        start = time.perf_counter()
+        result = function(case)
+        elapsed = time.perf_counter() - start
+    return result, elapsed
+
+
+def run(cases, engines=None):
+    """
+    Runs the engines on the cases.
+
+    Cases the reference fails on (e.g. operation_count with no detections) are skipped.
+
+    Returns
+    -------
+    report: dict
+        per engine: number of cases, skipped cases, mismatching cases, reference and candidate run times.
+    """
+    report = {}
+    for name in engines or ENGINES:
+        engine = ENGINES[name]
+        result = dict(cases=0, skipped=0, mismatches=[], t_reference=0.0, t_candidate=0.0)
+        for case in cases:
+            if engine['prepare'] is not None:
+                case = engine['prepare'](case)
+            if case is None:
+                result['skipped'] += 1
+                continue
+            try:
+                expected, t_reference = _timed(engine['reference'], case)
+            except (ValueError, IndexError):
+                result['skipped'] += 1
+                continue
+            obtained, t_candidate = _timed(engine['candidate'], case)
+            result['cases'] += 1
+            result['t_reference'] += t_reference
+            result['t_candidate'] += t_candidate
+            if not engine['compare'](expected, obtained):
+                result['mismatches'].append(case)
+        report[name] = result
+    return report
+
+
+def get_report(report):
+    """Formats the report of run."""
+    lines = [f'{"engine":24s} {"cases":>6s} {"skipped":>8s} {"mismatch":>9s} {"ref (s)":>9s} {"cand (s)":>9s} '
+             f'{"speedup":>8s}',
+             '- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -']
+    for name, result in report.items():
+        speedup = result['t_reference'] / result['t_candidate'] if result['t_candidate'] > 0 else float('nan')
+        lines.append(f'{name:24s} {result["cases"]:6d} {result["skipped"]:8d} {len(result["mismatches"]):9d} '
+                     f'{result["t_reference"]:9.3f} {result["t_candidate"]:9.3f} {speedup:7.2f}x')
+    return '\n'.join(lines)
+
+
+def check(n_cases=500, seed=0, engines=None):
+    """Runs the harness, prints the report, and asserts that no engine mismatches the reference."""
+    report = run(make_cases(n_cases, seed), engines)
+    print(get_report(report))
+    for name, result in report.items():
+        if result['mismatches']:
+            case = result['mismatches'][0]
+            raise AssertionError(f'{name}: {len(result["mismatches"])} mismatching cases, e.g. ({case["generator"]}) '
+                                 f'detections={case["detections"].tolist()}, '
+                                 f'annotations={case["annotations"].tolist()}, '
+                                 f'inn_tol_win={case["inn_tol_win"]}, out_tol_win={case["out_tol_win"]}')
+    return report
+
+
+# Reference and candidate engines
+# - - - - - - - - - - - - - - - -
+
+def _reference_operations(case):
+    return reference.operation_count(case['detections'], case['annotations'], case['inn_tol_win'], case['out_tol_win'])
+
+
+def _candidate_operations(case):
+    return operation_count(case['detections'], case['annotations'], case['inn_tol_win'], case['out_tol_win'])
+
+
+def _session_operations(case):
+    session = CorrectionSession(case['detections'], case['annotations'], case['inn_tol_win'], case['out_tol_win'])
+    return session.operations, session.annotation_efficiency()
+
+
+def _incremental_session_operations(case):
+    """Reaches the case's detections by editing: moving and deleting decoy beats, and inserting the missing ones."""
+    detections = case['detections']
+    rng = np.random.default_rng(detections.size)
+    decoys = rng.uniform(0, 30, 1 + detections.size // 4)
+    session = CorrectionSession(np.concatenate((detections[::2], decoys)), case['annotations'],
+                                case['inn_tol_win'], case['out_tol_win'])
+    missing = list(detections[1::2])
+
+    def row(detection):
+        return np.searchsorted(session.detections, detection + TIE_OFFSET)
+
+    for decoy in decoys:
+        if missing:
+            session.move_beat(row(decoy), missing.pop())
+        else:
+            session.delete_beat(row(decoy))
+    for detection in missing:
+        session.insert_beat(detection)
+    return session.operations, session.annotation_efficiency()
+
+
+def _equal_operations(expected, obtained):
+    """Equality of (operations, ae); operation_count returns ([], 1) if there are no detections nor annotations."""
+    if len(expected[0]) == 0:
+        return len(obtained[0]) == 0
+    return exactly_equal(expected, obtained)
+
+
+def _on_grid(case):
+    """The case, quantised to the compact resolution."""
+    case = dict(case)
+    for key in ('detections', 'annotations'):
+        case[key] = quantise(case[key], COMPACT_RESOLUTION) * COMPACT_RESOLUTION
+    return case
+
+
+def _compact_operations(case):
+    return operation_count_compact(case['detections'], case['annotations'], case['inn_tol_win'], case['out_tol_win'],
+                                   COMPACT_RESOLUTION)
+
+
+def _equal_compact(expected, obtained):
+    """Equality at the compact resolution: flags, (quantised) times and shifts, and annotation efficiency."""
+    operations, ae = expected
+    if len(operations) == 0:
+        return len(obtained[0]) == 0 and obtained[1][0] == ae
+    expanded = expand_operations(obtained[0], COMPACT_RESOLUTION)
+    shifted = operations[:, 4] != 0
+    return (expanded.shape == operations.shape and
+            np.array_equal(expanded[:, 1:4], operations[:, 1:4]) and
+            np.array_equal(expanded[:, 4] != 0, shifted) and
+            np.array_equal(obtained[0]['time'], quantise(operations[:, 0] - TIE_OFFSET, COMPACT_RESOLUTION)) and
+            np.array_equal(obtained[0]['shift'][shifted],
+                           quantise(operations[shifted, 4] + TIE_OFFSET, COMPACT_RESOLUTION)) and
+            exactly_equal(tuple(ae), tuple(obtained[1])))
+
+
+def _reference_f_measure(case):
+    return reference.f_measure(case['annotations'], case['detections'], case['inn_tol_win'])
+
+
+def _candidate_f_measure(case):
+    return f_measure(case['annotations'], case['detections'], case['inn_tol_win'])
+
+
+def _reference_suite(case):
+    """F-measure (of the sorted detections) and annotation efficiency."""
+    _, ae = reference.operation_count(case['detections'], case['annotations'], case['inn_tol_win'],
+                                      case['out_tol_win'])
+    return (reference.f_measure(case['annotations'], np.sort(case['detections']), case['inn_tol_win']),
+            ae[0] if isinstance(ae, tuple) else ae)
+
+
+def _candidate_suite(case):
+    scores = evaluate(case['annotations'], case['detections'], ['f_measure', 'annotation_efficiency'],
+                      case['inn_tol_win'], case['out_tol_win'])
+    return scores['f_measure'], scores['annotation_efficiency']
+
+
+def _reference_registry(case):
+    """Continuity-based metrics, P-score and Cemgil accuracy."""
+    return (reference.continuity(case['annotations'], case['detections']) +
+            (reference.p_score(case['annotations'], case['detections']),
+             reference.cemgil(case['annotations'], case['detections'])))
+
+
+def _candidate_registry(case):
+    scores = evaluate(case['annotations'], case['detections'], REGISTRY_METRICS)
+    return tuple(scores[name] for name in REGISTRY_METRICS)
+
+
+def _separated(case):
+    """The case, only if the annotations are more than 2 * inn_tol_win apart (see process_operations)."""
+    if case['detections'].size == 0 or np.any(np.diff(case['annotations']) <= 2 * case['inn_tol_win']):
+        return None
+    return case
+
+
+def _reference_transformed(case):
+    operations, _ = _reference_operations(case)
+    transformed = reference.process_operations(operations)
+    return transformed, reference.f_measure(transformed, case['annotations'], case['inn_tol_win'])
+
+
+def _candidate_transformed(case):
+    operations, _ = _candidate_operations(case)
+    transformed, counts, _ = process_operations(operations, case['annotations'], case['inn_tol_win'],
+                                                return_stats=True)
+    return transformed, f_measure_from_counts(*counts)
+
+
+register_engine('operation_count', _reference_operations, _candidate_operations, _equal_operations)
+register_engine('session', _reference_operations, _session_operations, _equal_operations)
+register_engine('session (incremental)', _reference_operations, _incremental_session_operations, _equal_operations)
+register_engine('compact (ms)', _reference_operations, _compact_operations, _equal_compact, _on_grid)
+register_engine('f_measure', _reference_f_measure, _candidate_f_measure)
+register_engine('transformed f_measure', _reference_transformed, _candidate_transformed, prepare=_separated)
+register_engine('metric suite', _reference_suite, _candidate_suite)
+register_engine('metric registry', _reference_registry, _candidate_registry)
+register_engine('variations', lambda case: reference.variations(case['detections']),
+                lambda case: variations(case['detections']))
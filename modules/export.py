@@ -0,0 +1,233 @@
+"""
+This module contains the export functionality for long-form timelines.
+
+- export_svg: a single (lightweight) SVG, written directly from the operations matrix,
+  i.e. without matplotlib (one path per type of element instead of one artist per operation);
+- export_tiles: the timeline split into fixed-duration tiles (e.g. PNG), each rendered with
+  plot_operations, in parallel processes.
+
+"""
+import numpy as np
+
+from modules.operating import detail_operations
+
+# Colors (SVG equivalents of the plotting col_dict)
+svg_col_dict = {'Annotations': '#808080',
+                'Detections': '#1f77b4',
+                'Insertions': '#2ca02c',
+                'Deletions': '#ff7f0e',
+                'Shifts': '#db7093'}
+
+# Dash patterns (SVG equivalents of the plotting lin_dict)
+svg_dash_dict = {'Annotations': None, 'Detections': None, 'Insertions': '6,2,1,2', 'Deletions': '1,2',
+                 'Shifts': '1,2'}
+
+# Length of the arrowheads of the shifts, in pixels
+ARROW_HEAD = 6
+
+# Horizontal margin (in inches) around the axes of the tiles, for the tick labels
+TILE_MARGIN = 0.4
+
+# SID Labels
+SVG_SID_chars = {'Shifts': 'S', 'Insertions': 'I', 'Deletions': 'D'}
+
+
+def _svg_lines(xs, y_from, y_to, label, dashed=True):
+    """A single path with the vertical lines at the x positions."""
+    if len(xs) == 0:
+        return ''
+    d = ''.join(f'M{x:.2f} {y_from}V{y_to}' for x in xs)
+    dash = f' stroke-dasharray="{svg_dash_dict[label]}"' if dashed and svg_dash_dict[label] else ''
+    return f'<path d="{d}" stroke="{svg_col_dict[label]}"{dash} fill="none"/>\n'
+
+
+def _svg_windows(lefts, rights, y_from, y_to, label):
+    """A single path with the (tolerance window) rectangles."""
+    if len(lefts) == 0:
+        return ''
+    d = ''.join(f'M{left:.2f} {y_from}H{right:.2f}V{y_to}H{left:.2f}Z' for left, right in zip(lefts, rights))
+    return f'<path d="{d}" fill="{svg_col_dict[label]}" fill-opacity="0.3" stroke="none"/>\n'
+
+
+def to_svg(operations, annotations, inn_tol_win=0.07, out_tol_win=1.0, px_per_second=50, height=120,
+           tick_every=10, sid_labels=True):
+    """
+    Builds the SVG of the operations (as a 'single' plot_operations figure: annotations and
+    tolerance windows on the upper half, operations on the lower half).
+
+    Parameters
+    ----------
+    operations : nparray
+        matrix of operations (see operation_count).
+    annotations : list/nparray
+        ground-truth annotation
+    inn_tol_win : float (optional)
+        inner tolerance window (+- interval) in seconds
+        (Default value = 0.07)
+    out_tol_win : float (optional)
+        outer tolerance window (+- interval) in seconds
+        (Default value = 1)
+    px_per_second : float (optional)
+        horizontal scale
+        (Default value = 50)
+    height : int (optional)
+        height of the timeline in pixels
+        (Default value = 120)
+    tick_every : float (optional)
+        interval between time ticks in seconds
+        (Default value = 10)
+    sid_labels : bool (optional)
+        draw the SID (Shift, Insert, Delete) labels
+        (Default value = True)
+
+    Returns
+    -------
+    svg: str
+    """
+    annotations = np.asarray(annotations)
+    detections, insertions, deletions, shift_result, un_shifted, idx_shifts, idx_insertions, \
+        idx_deletions = detail_operations(operations)
+
+    end = max(np.max(operations[:, 0], initial=0), np.max(annotations, initial=0)) + out_tol_win
+    width = end * px_per_second
+    top, mid, bottom = 0, height / 2, height
+
+    def x(times):
+        return np.asarray(times) * px_per_second
+
+    svg = (f'<svg xmlns="http://www.w3.org/2000/svg" width="{width:.0f}" height="{height + 20}" '
+           f'viewBox="0 0 {width:.2f} {height + 20}" font-family="sans-serif" font-size="9">\n')
+    # upper half: tolerance windows and annotations
+    svg += _svg_windows(x(annotations - inn_tol_win), x(annotations + inn_tol_win), top, mid, 'Annotations')
+    shifted = annotations[np.isin(annotations, shift_result)]
+    svg += _svg_windows(x(shifted - out_tol_win), x(shifted + out_tol_win), top, mid, 'Shifts')
+    svg += _svg_lines(x(annotations), top, mid, 'Annotations')
+
+    # lower half: operations
+    svg += _svg_lines(x(detections), mid, bottom, 'Detections')
+    svg += _svg_lines(x(insertions), mid, bottom, 'Insertions')
+    svg += _svg_lines(x(deletions), mid, bottom, 'Deletions')
+    svg += _svg_lines(x(un_shifted), mid, bottom, 'Shifts')
+    svg += _svg_lines(x(shift_result), mid, bottom, 'Shifts', dashed=False)
+    if len(un_shifted) > 0:
+        y_arrow = 3 * height / 4
+        d = ''.join(f'M{x_from:.2f} {y_arrow}H{x_to:.2f}' for x_from, x_to in zip(x(un_shifted), x(shift_result)))
+        svg += f'<path d="{d}" stroke="{svg_col_dict["Shifts"]}" stroke-dasharray="6,2,1,2" fill="none"/>\n'
+        # the arrowheads: a chevron at the end of each arrow (a marker-end would only mark the end of the path)
+        ends, sides = x(shift_result), np.sign(x(shift_result) - x(un_shifted))
+        d = ''.join(f'M{x_to - side * ARROW_HEAD:.2f} {y_arrow - ARROW_HEAD / 2}L{x_to:.2f} {y_arrow}'
+                    f'L{x_to - side * ARROW_HEAD:.2f} {y_arrow + ARROW_HEAD / 2}' for x_to, side in zip(ends, sides))
+        svg += f'<path d="{d}" stroke="{svg_col_dict["Shifts"]}" fill="none"/>\n'
+
+    if sid_labels:
+        for label, idx in (('Insertions', idx_insertions), ('Deletions', idx_deletions), ('Shifts', idx_shifts)):
+            svg += ''.join(f'<text x="{pos:.2f}" y="{mid + 3}" text-anchor="middle">{SVG_SID_chars[label]}</text>'
+                           for pos in x(operations[idx, 0]))
+        svg += '\n'
+
+    # time axis
+    svg += f'<path d="M0 {mid}H{width:.2f}M0 {bottom}H{width:.2f}" stroke="black" fill="none"/>\n'
+    ticks = np.arange(0, end, tick_every)
+    svg += ''.join(f'<text x="{pos:.2f}" y="{bottom + 12}" text-anchor="middle">{tick:g}</text>'
+                   for pos, tick in zip(x(ticks), ticks))
+    svg += '\n</svg>\n'
+
+    return svg
+
+
+def export_svg(operations, annotations, path, inn_tol_win=0.07, out_tol_win=1.0, **kwargs):
+    """
+    Saves the SVG of the operations (see to_svg).
+
+    Returns
+    -------
+    path: str
+    """
+    with open(path, 'w') as svg_file:
+        svg_file.write(to_svg(operations, annotations, inn_tol_win, out_tol_win, **kwargs))
+    return path
+
+
+def _render_tile(args):
+    """Renders a tile with plot_operations (runs in a worker process)."""
+    operations, annotations, path, start, end, title, inn_tol_win, out_tol_win, plot_type, dpi = args
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from modules.plotting import plot_operations
+
+    from matplotlib.transforms import Bbox
+
+    fig, ax, artists = plot_operations(operations, annotations, title, inn_tol_win, out_tol_win, plot_type,
+                                       return_artists=True)
+    axis = ax[0] if plot_type == 'subplots' else ax
+    axis.set_xlim(start, end)
+    # the SID labels aren't clipped to the axes: only the ones of the tile are drawn
+    for label in artists.get('labels', []):
+        label.set_visible(start <= label.xy[0] <= end)
+
+    # same width for all the tiles: the (tick) labels at the tile edges don't change it
+    tight = fig.get_tightbbox(fig.canvas.get_renderer())
+    position = axis.get_position()
+    left = position.x0 * fig.get_figwidth() - TILE_MARGIN
+    right = max(tight.x1, position.x1 * fig.get_figwidth() + TILE_MARGIN)
+    fig.savefig(path, dpi=dpi, bbox_inches=Bbox.from_extents(left, tight.y0, right, tight.y1).padded(0.1))
+    plt.close(fig)
+
+    return path
+
+
+def export_tiles(operations, annotations, path='figures/tile_{:03d}.png', tile_duration=30.0, title='',
+                 inn_tol_win=0.07, out_tol_win=1.0, plot_type='single', dpi=100, n_jobs=None):
+    """
+    Splits the timeline into fixed-duration tiles, and renders them (see plot_operations) in parallel.
+
+    Parameters
+    ----------
+    operations : nparray
+        matrix of operations (see operation_count).
+    annotations : list/nparray
+        ground-truth annotation
+    path : str (optional)
+        path of the tiles, formatted with the tile index (the extension sets the format)
+        (Default value = 'figures/tile_{:03d}.png')
+    tile_duration : float (optional)
+        duration of each tile in seconds
+        (Default value = 30)
+    title : str (optional)
+        title of the figures (followed by the tile interval)
+        (Default value = '')
+    inn_tol_win, out_tol_win, plot_type:
+        see plot_operations
+        (Default value of plot_type = 'single')
+    dpi : int (optional)
+        resolution of the (raster) tiles
+        (Default value = 100)
+    n_jobs : int (optional)
+        number of parallel processes (None: as many as CPUs)
+        (Default value = None)
+
+    Returns
+    -------
+    paths: list
+        paths of the tiles.
+    """
+    # (imported here: multiprocessing is only loaded when exporting tiles)
+    from concurrent.futures import ProcessPoolExecutor
+
+    annotations = np.asarray(annotations)
+    end = max(np.max(operations[:, 0], initial=0), np.max(annotations, initial=0))
+    n_tiles = max(1, int(np.ceil(end / tile_duration)))
+    tasks = []
+    for i in range(n_tiles):
+        start, stop = i * tile_duration, (i + 1) * tile_duration
+        # operations (and annotations) whose drawing may reach the tile
+        in_tile = (operations[:, 0] >= start - out_tol_win) & (operations[:, 0] <= stop + out_tol_win)
+        anns = annotations[(annotations >= start - out_tol_win) & (annotations <= stop + out_tol_win)]
+        tasks.append((operations[in_tile], anns, path.format(i), start, stop, f'{title} [{start:g}-{stop:g}s]',
+                      inn_tol_win, out_tol_win, plot_type, dpi))
+
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        paths = list(executor.map(_render_tile, tasks))
+
+    return paths
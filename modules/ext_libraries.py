@@ -1,5 +1,20 @@
+from bisect import bisect_left, bisect_right
+
 import numpy as np
 
+from modules.operating import BeatMatching, _closest_index, operation_count
+
+# Registered evaluation metrics: name (or names of the returned values) -> function(matching, inn_tol_win)
+METRICS = {}
+
+# Phase and tempo tolerances of the continuity-based metrics (relative to the inter-annotation interval)
+PHASE_TOLERANCE = 0.175
+TEMPO_TOLERANCE = 0.175
+# Tolerance of the P-score (relative to the median inter-annotation interval)
+P_SCORE_TOLERANCE = 0.2
+# Standard deviation of the Cemgil accuracy Gaussian error function, in seconds
+CEMGIL_SIGMA = 0.04
+
 
 def variations(sequence, offbeat=True, double=True, half=True,
                triple=True, third=True):
@@ -111,14 +126,14 @@ def variations(sequence, offbeat=True, double=True, half=True,
     return sequences, type_sequences
 
 
-def f_measure(annotations, detections, inn_tol_win=0.07):
+def f_measure_counts(annotations, detections, inn_tol_win=0.07):
     """
-    Calculates the F-measure as used in (Dixon, 2006) and (Dixon, 2007).
+    Counts the hits, false positives and false negatives of the F-measure as used in (Dixon, 2006) and (Dixon, 2007).
 
     @param anns sequence of ground truth beat annotations (in seconds)
     @param beats sequence of estimated beat times (in seconds)
 
-    @returns f - the F-measure
+    @returns hits, fp, fn - the number of correct detections, false positives and false negatives
     """
     # Adapted from:
     #
@@ -145,8 +160,8 @@ def f_measure(annotations, detections, inn_tol_win=0.07):
     # Check if there are any detections, if not then exit
     if detections.size == 0:
         print("beat sequence is empty, assigning zero to all outputs [f,p,r,a]")
-        f = 0
-        return f
+        fn = annotations.size
+        return hits, fp, fn
 
     # get the threshold parameter for the tolerance window
     delta = inn_tol_win
@@ -180,6 +195,13 @@ def f_measure(annotations, detections, inn_tol_win=0.07):
     # add any remaining detections to the number of false positives
     fp = fp + detections.size
 
+    return hits, fp, fn
+
+
+def f_measure_from_counts(hits, fp, fn):
+    """
+    Calculates the F-measure from the number of correct detections, false positives and false negatives.
+    """
     # calculate precision, p
     if ((hits + fp) > 0):
         p = (hits / (hits+fp))
@@ -199,3 +221,251 @@ def f_measure(annotations, detections, inn_tol_win=0.07):
         f = 0
 
     return f
+
+
+def f_measure(annotations, detections, inn_tol_win=0.07):
+    """
+    Calculates the F-measure as used in (Dixon, 2006) and (Dixon, 2007).
+
+    @param anns sequence of ground truth beat annotations (in seconds)
+    @param beats sequence of estimated beat times (in seconds)
+
+    @returns f - the F-measure
+    """
+    return f_measure_from_counts(*f_measure_counts(annotations, detections, inn_tol_win))
+
+
+def register_metric(names, function):
+    """
+    Registers an evaluation metric, computed from the matching shared by all the metrics (see evaluate).
+
+    Parameters
+    ----------
+    names : str/tuple
+        name of the metric, or names of the values it returns (e.g. ('cmlc', 'cmlt', 'amlc', 'amlt')).
+    function : callable
+        function(matching, inn_tol_win) of the BeatMatching of the track (see operating.BeatMatching)
+        and of the inner tolerance window, returning the value(s) of the metric.
+    """
+    METRICS[names] = function
+
+
+def evaluate(annotations, detections, metrics=None, inn_tol_win=0.07, out_tol_win=1.0):
+    """
+    Calculates the registered metrics and the annotation efficiency of a track, from a single
+    matching of the (sorted) detections and annotations.
+
+    Parameters
+    ----------
+    annotations : list/nparray
+        ground-truth annotations.
+    detections : list/nparray
+        beat detections.
+    metrics : list (optional)
+        names of the metrics to calculate (None: all the registered ones and 'annotation_efficiency')
+        (default value=None)
+    inn_tol_win : float
+        inner tolerance window in seconds
+        (default value=0.07)
+    out_tol_win : float
+        outer tolerance window in seconds (of the annotation efficiency)
+        (default value=1)
+
+    Returns
+    -------
+    scores: dict
+        metric name -> value.
+    """
+    matching = BeatMatching(detections, annotations)
+
+    scores = {}
+    for names, function in METRICS.items():
+        names_tuple = (names,) if isinstance(names, str) else names
+        if metrics is not None and not set(names_tuple) & set(metrics):
+            continue
+        values = function(matching, inn_tol_win)
+        scores.update(zip(names_tuple, (values,) if isinstance(names, str) else values))
+
+    if metrics is None or 'annotation_efficiency' in metrics:
+        if (matching.detections.size == 0) != (matching.annotations.size == 0):
+            # every annotation is an insertion (or every detection a deletion)
+            scores['annotation_efficiency'] = 0.0
+        else:
+            _, ae = operation_count(inn_tol_win=inn_tol_win, out_tol_win=out_tol_win, matching=matching)
+            scores['annotation_efficiency'] = float(ae[0] if isinstance(ae, tuple) else ae)
+
+    if metrics is not None:
+        scores = {name: scores[name] for name in metrics}
+
+    return scores
+
+
+def f_measure_matched(matching, inn_tol_win=0.07):
+    """
+    Calculates the F-measure (see f_measure) of the sorted detections and annotations of a matching.
+
+    Counted from the detections inside the tolerance window of each annotation. The tracks with several
+    detections in a window, or in overlapping windows, are counted annotation by annotation (removing the
+    detections from the window as f_measure does, i.e. one every two), so that the result is always the same.
+    """
+    # (as in f_measure) negative times aren't evaluated
+    a_first = np.searchsorted(matching.annotations, 0, 'left')
+    d_first = np.searchsorted(matching.detections, 0, 'left')
+    annotations = matching.annotations[a_first:]
+    detections = matching.detections[d_first:]
+    if detections.size == 0:
+        return float(f_measure(annotations, detections, inn_tol_win))
+
+    lo, hi = matching.window(inn_tol_win)
+    lo = np.maximum(lo[a_first:], d_first)
+    hi = np.maximum(hi[a_first:], d_first)
+    in_window = hi - lo
+    if np.all(in_window <= 1) and np.all(hi[:-1] <= lo[1:]):
+        hits = int(np.count_nonzero(in_window))
+        return float(f_measure_from_counts(hits, detections.size - hits, annotations.size - hits))
+
+    hits, fp, fn = 0, 0, 0
+    remaining = detections.tolist()
+    for ann in annotations:
+        first = bisect_left(remaining, ann - inn_tol_win)
+        n_in_window = bisect_right(remaining, ann + inn_tol_win) - first
+        # f_measure deletes the indexes of the window one at a time (i.e. after the first deletion,
+        # the following indexes point one detection further)
+        for k in range(n_in_window):
+            del remaining[first + k]
+        hits += n_in_window > 0
+        fp += n_in_window > 1
+        fn += n_in_window == 0
+    fp += len(remaining)
+
+    return float(f_measure_from_counts(hits, fp, fn))
+
+
+def _intervals(beats):
+    """Interval to the previous beat (to the next one for the first beat)."""
+    intervals = np.diff(beats)
+    return np.concatenate((intervals[:1], intervals))
+
+
+def _cml(detections, annotations, positions):
+    """
+    CMLc and CMLt of the (sorted) detections against the (sorted) annotations,
+    given the positions of the detections in the annotations.
+    """
+    if detections.size == 0 and annotations.size == 0:
+        return 1.0, 1.0
+    if detections.size < 2 or annotations.size < 2:
+        return 0.0, 0.0
+
+    # each detection is compared to its closest annotation: both its phase and its interval must be correct
+    closest = _closest_index(annotations, detections, positions)
+    ann_intervals = _intervals(annotations)[closest]
+    phase_correct = np.abs(detections - annotations[closest]) <= PHASE_TOLERANCE * ann_intervals
+    tempo_correct = np.abs(_intervals(detections) - ann_intervals) <= TEMPO_TOLERANCE * ann_intervals
+    correct = np.concatenate(([0], phase_correct & tempo_correct, [0])).astype(int)
+
+    # longest run of consecutive correct detections
+    starts, = np.nonzero(np.diff(correct) == 1)
+    ends, = np.nonzero(np.diff(correct) == -1)
+    n_beats = max(detections.size, annotations.size)
+
+    return float(np.max(ends - starts, initial=0) / n_beats), float(np.sum(ends - starts) / n_beats)
+
+
+# The variations (see variations) taken one every step beats, from start, of a denser sequence
+# (the annotations, or their double or triple tempo variation): name -> (sequence, start, step)
+SUB_VARIATIONS = {
+    'Offbeat': ('Double', 1, 2),
+    'Half-Odd': ('Original', 0, 2),
+    'Half-Even': ('Original', 1, 2),
+    'Third-1': ('Original', 0, 3),
+    'Third-2': ('Original', 1, 3),
+    'Third-3': ('Original', 2, 3),
+}
+
+
+def continuity(matching, inn_tol_win=None):
+    """
+    Calculates the continuity-based metrics (Hainsworth, 2004) and (Klapuri et al., 2006), as in madmom.
+
+    The detections are only searched in the annotations (in the matching) and in their double and
+    triple tempo variations: their positions in the other variations follow from these.
+
+    Parameters
+    ----------
+    matching : BeatMatching
+        matching of the detections and annotations (see operating.BeatMatching).
+    inn_tol_win : float
+        not used (the tolerances are PHASE_TOLERANCE and TEMPO_TOLERANCE)
+
+    Returns
+    -------
+    cmlc, cmlt, amlc, amlt: float
+        longest continuous (c) and total (t) correctly tracked fraction of the beats, at the correct
+        metrical level (CML) or at any of the allowed ones (AML, see variations).
+    """
+    detections = matching.detections
+    if detections.size == 0 and matching.annotations.size == 0:
+        return 1.0, 1.0, 1.0, 1.0
+    if detections.size < 2 or matching.annotations.size < 2:
+        return 0.0, 0.0, 0.0, 0.0
+
+    sequences, type_sequences = variations(matching.annotations)
+    # the variations of the sorted annotations are sorted
+    sequences = dict(zip(type_sequences, (np.asarray(sequence, dtype=float) for sequence in sequences)))
+
+    positions = {'Original': matching.positions}
+    for name in ('Double', 'Triple'):
+        positions[name] = np.searchsorted(sequences[name], detections)
+    for name, (dense, start, step) in SUB_VARIATIONS.items():
+        # number of beats start, start + step, ... before the position in the dense sequence
+        positions[name] = np.maximum(positions[dense] - start + step - 1, 0) // step
+
+    cmlc, cmlt = _cml(detections, sequences['Original'], positions['Original'])
+
+    amlc, amlt = cmlc, cmlt
+    for name, sequence in sequences.items():
+        # (e.g. the third variations of a short sequence may be empty)
+        if name != 'Original' and sequence.size > 0:
+            c, t = _cml(detections, sequence, positions[name])
+            amlc, amlt = max(amlc, c), max(amlt, t)
+
+    return cmlc, cmlt, amlc, amlt
+
+
+def p_score(matching, inn_tol_win=None):
+    """
+    Calculates the P-score (McKinney et al., 2007): the number of (detection, annotation) pairs closer
+    than P_SCORE_TOLERANCE times the median inter-annotation interval, over the length of the longest sequence.
+    """
+    detections = matching.detections
+    annotations = matching.annotations
+    if detections.size == 0 and annotations.size == 0:
+        return 1.0
+    if detections.size == 0 or annotations.size < 2:
+        return 0.0
+
+    lo, hi = matching.window(P_SCORE_TOLERANCE * np.median(np.diff(annotations)))
+    return float(np.sum(hi - lo) / max(detections.size, annotations.size))
+
+
+def cemgil(matching, inn_tol_win=None):
+    """
+    Calculates the Cemgil accuracy (Cemgil et al., 2001): a Gaussian error function (of standard deviation
+    CEMGIL_SIGMA) of the closest detection to each annotation, over the mean length of the sequences.
+    """
+    detections = matching.detections
+    annotations = matching.annotations
+    if detections.size == 0 and annotations.size == 0:
+        return 1.0
+    if detections.size == 0 or annotations.size == 0:
+        return 0.0
+
+    accuracy = np.sum(np.exp(-matching.errors ** 2 / (2 * CEMGIL_SIGMA ** 2)))
+    return float(accuracy / (0.5 * (detections.size + annotations.size)))
+
+
+register_metric('f_measure', f_measure_matched)
+register_metric(('cmlc', 'cmlt', 'amlc', 'amlt'), continuity)
+register_metric('p_score', p_score)
+register_metric('cemgil', cemgil)
@@ -6,6 +6,9 @@ import numpy as np
 
 from modules.utils import double_check_accounted
 
+# Offset added to the detections, to prevent a detection falling exactly midway between two annotations
+TIE_OFFSET = 1e-7
+
 
 def get_summary(type_var, ann_eff, tup_f_m=(0.0, 1.0)):
 
@@ -62,16 +65,212 @@ def annotation_efficiency(operations=None):
     return ae, n_detections, n_insertions, n_deletions, n_shifts
 
 
-def process_operations(operations=None):
-    """ returns the transformed detections """
+def local_annotation_efficiency(operations=None, window=10.0, hop=1.0):
+    """
+    Calculates the annotation efficiency and stats over sliding time windows,
+    with cumulative sums and binary searches (O(N log N + W log N) for N operations and W windows).
+
+    Parameters
+    ----------
+    operations : nparray
+        matrix of operations.
+    window : float
+        duration of the windows in seconds
+        (default value=10)
+    hop : float
+        hop between windows in seconds
+        (default value=1)
+
+    Returns
+    -------
+    times: nparray
+        centre of each window (windows start at 0 and are half-open: [start, start + window),
+        the last one includes the last operation)
+    ae: nparray
+        annotation efficiency of each window (nan if there are no operations in it)
+    n_detections: nparray
+        number of (correct) detections in each window
+    n_insertions: nparray
+        number of (correct) insertions in each window
+    n_deletions: nparray
+        number of (correct) deletions in each window
+    n_shifts: nparray
+        number of (correct) shifts in each window (at the unshifted detection)
+
+    """
+    order = np.argsort(operations[:, 0], kind='stable')
+    positions = operations[order, 0]
+    # same counts as annotation_efficiency
+    counts = np.column_stack((operations[order, 1:4], operations[order, 4] != 0))
+    cumulative = np.vstack((np.zeros((1, 4)), np.cumsum(counts, axis=0)))
+
+    end = positions[-1] if len(positions) > 0 else 0
+    # the last window starts after end - window, so that it includes the last operation
+    n_windows = int(np.floor((end - window) / hop)) + 2 if end >= window else 1
+    starts = hop * np.arange(n_windows)
+    lo = np.searchsorted(positions, starts, 'left')
+    hi = np.searchsorted(positions, starts + window, 'left')
+    n_detections, n_insertions, n_deletions, n_shifts = (cumulative[hi] - cumulative[lo]).T
+
+    total = n_detections + n_insertions + n_deletions + n_shifts
+    ae = np.divide(n_detections, total, out=np.full(len(starts), np.nan), where=total > 0)
+
+    return starts + window / 2, ae, n_detections, n_insertions, n_deletions, n_shifts
+
+
+def detail_operations(ops):
+    """Gets the list of operations and indexes from the full operations matrix."""
+    idx_shi = np.where(ops[:, 4] != 0)[0]
+    idx_ins = np.where(ops[:, 2] == 1)[0]
+    idx_del = np.where(ops[:, 3] == 1)[0]
+    lst_det = ops[ops[:, 1] == 1, 0]
+    lst_ins = ops[ops[:, 2] == 1, 0]
+    lst_del = ops[ops[:, 3] == 1, 0]
+    shi_res = ops[idx_shi, 0] + ops[idx_shi, 4]
+    un_shi = ops[idx_shi, 0]
+
+    return lst_det, lst_ins, lst_del, shi_res, un_shi, idx_shi, idx_ins, idx_del
+
+
+def _closest_index(values, targets, positions=None):
+    """
+    Index of the closest (sorted) value to each target (the first one on ties), given the positions
+    of the targets in the values (i.e. np.searchsorted(values, targets)) if already known.
+    """
+    if positions is None:
+        positions = np.searchsorted(values, targets)
+    before = np.maximum(positions - 1, 0)
+    after = np.minimum(positions, len(values) - 1)
+    closest = np.where(np.abs(values[before] - targets) <= np.abs(values[after] - targets), before, after)
+    # first of any repeated values
+    first = np.arange(len(values))
+    first[1:][values[1:] == values[:-1]] = 0
+    return np.maximum.accumulate(first)[closest]
+
+
+class BeatMatching:
+    """
+    Sorted detections and annotations, and the closest detection to each annotation (and vice versa).
+
+    The matching is computed once per track and shared by operation_count and the evaluation
+    metrics (see ext_libraries.evaluate), which then only search the sorted sequences.
+    The closest detections are the ones of operation_count (i.e. with the TIE_OFFSET).
+
+    Parameters
+    ----------
+    detections : list/nparray
+        beat detections.
+    annotations : list/nparray
+        ground-truth annotations.
+    sort : bool
+        sort the detections and annotations (False if they're already sorted)
+        (default value=True)
+    """
+
+    def __init__(self, detections, annotations, sort=True):
+        self.detections = np.asarray(detections, dtype=float)
+        self.annotations = np.asarray(annotations, dtype=float)
+        if sort:
+            self.detections = np.sort(self.detections)
+            self.annotations = np.sort(self.annotations)
+
+        # position of each detection in the annotations (see np.searchsorted)
+        self.positions = np.searchsorted(self.annotations, self.detections)
+        # index of the closest detection to each annotation, and of the closest annotation to each detection
+        # (empty if there's nothing to match with)
+        if self.detections.size > 0 and self.annotations.size > 0:
+            self.closest_detection = _closest_index(self.detections + TIE_OFFSET, self.annotations)
+            self.closest_annotation = _closest_index(self.annotations, self.detections, self.positions)
+        else:
+            self.closest_detection = np.zeros(0, dtype=int)
+            self.closest_annotation = np.zeros(0, dtype=int)
+        # signed error of the closest detection to each annotation
+        self.errors = self.detections[self.closest_detection] - self.annotations[:self.closest_detection.size]
+
+        self._windows = {}
+
+    def window(self, width):
+        """
+        Detections inside the (+- width) window of each annotation.
+
+        Returns
+        -------
+        lo, hi: nparray
+            for each annotation, the detections inside its window are detections[lo:hi].
+        """
+        if width not in self._windows:
+            self._windows[width] = (np.searchsorted(self.detections, self.annotations - width, 'left'),
+                                    np.searchsorted(self.detections, self.annotations + width, 'right'))
+        return self._windows[width]
+
+
+def process_operations(operations=None, annotations=None, inn_tol_win=0.07, return_stats=False):
+    """
+    Returns the transformed detections.
+
+    Parameters
+    ----------
+    operations : nparray
+        matrix of operations (see operation_count).
+    annotations : nparray (optional)
+        annotations the operations were counted against (required with return_stats)
+    inn_tol_win : float (optional)
+        inner tolerance window in seconds (the one used in operation_count)
+        (default value=0.07)
+    return_stats: bool (optional)
+        also return the F-measure counts of the transformed detections and the matching,
+        derived from the operations instead of re-matching them against the annotations
+        (default value=False)
+
+    Returns
+    -------
+    transformed: nparray
+        sorted transformed detections.
+    counts: tuple (only if return_stats)
+        hits, fp, fn (see f_measure_counts).
+    ann_to_det: nparray (only if return_stats)
+        index of the transformed detection matching each annotation (-1 if none).
+        Annotations sharing a "good" detection (i.e. closer than 2 * inn_tol_win) match the same one:
+        the first counts as a hit, the others as false negatives. Negative times aren't counted (as in f_measure).
+    """
     ops = np.array(operations[np.where(operations[:, 3] != 1)], copy=True)
     transformed = ops[:, 0] + ops[:, 4]
-    transformed = np.sort(transformed)
+    if not return_stats:
+        transformed = np.sort(transformed)
+        return transformed
+
+    order = np.argsort(transformed)
+    transformed = transformed[order]
+    rows = np.empty(len(order), dtype=int)
+    rows[order] = np.arange(len(order))  # position of each (non deleted) row in transformed
+
+    annotations = np.sort(annotations)
+    ann_to_det = np.full(len(annotations), -1)
+
+    # good detections: (as in operation_count) the closest one to the annotation, if inside the window
+    idx_good, = np.nonzero(ops[:, 1] == 1)
+    if idx_good.size > 0:
+        good = ops[idx_good, 0]
+        closest = _closest_index(good, annotations)
+        inside = np.abs(good[closest] - annotations) <= inn_tol_win
+        ann_to_det[inside] = rows[idx_good[closest[inside]]]
 
-    return transformed
+    # shifts and insertions: the transformed detection is (up to rounding) the annotation itself
+    idx_other, = np.nonzero(ops[:, 1] != 1)
+    if idx_other.size > 0:
+        ann_to_det[_closest_index(annotations, transformed[rows[idx_other]])] = rows[idx_other]
 
+    # (as in f_measure) negative times aren't evaluated
+    matched = (ann_to_det >= 0) & (annotations >= 0)
+    matched[matched] = transformed[ann_to_det[matched]] >= 0
+    hits = np.unique(ann_to_det[matched]).size
+    fp = np.count_nonzero(transformed >= 0) - hits
+    fn = np.count_nonzero(annotations >= 0) - hits
 
-def operation_count(detections=None, annotations=None, inn_tol_win=0.07, out_tol_win=1.0):
+    return transformed, (hits, fp, fn), ann_to_det
+
+
+def operation_count(detections=None, annotations=None, inn_tol_win=0.07, out_tol_win=1.0, matching=None):
     """
     Counts the number of operations necessary to maximise the F-measure.
 
@@ -88,6 +287,9 @@ def operation_count(detections=None, annotations=None, inn_tol_win=0.07, out_tol
     out_tol_win : float
         outer tolerance window in seconds
         (default value=1)
+    matching : BeatMatching
+        matching of the detections and annotations, if already computed (e.g. by ext_libraries.evaluate)
+        (default value=None)
 
     Returns
     -------
@@ -96,15 +298,20 @@ def operation_count(detections=None, annotations=None, inn_tol_win=0.07, out_tol
     ae: float
         annotation efficiency.
     """
-    if (annotations.size < 1) and (detections.size < 1):
+    if matching is None:
+        matching = BeatMatching(detections, annotations)
+
+    if (matching.annotations.size < 1) and (matching.detections.size < 1):
         print('both the detections and annotations are empty, job done')
         operations = []
         ann_efficiency = 1
         return operations, ann_efficiency
+    if (matching.detections.size < 1):
+        raise ValueError('the detections are empty, there is nothing to operate on')
 
     # to prevent a detection falling exactly midway between two annotations
-    detections = np.sort(detections) + 1e-7
-    annotations = np.sort(annotations)
+    detections = matching.detections + TIE_OFFSET
+    annotations = matching.annotations
 
     annotations_accounted_for = np.zeros(len(annotations))  # mark already used annotations
     detections_accounted_for = np.zeros(len(detections))  # mark already used detections
@@ -115,9 +322,9 @@ def operation_count(detections=None, annotations=None, inn_tol_win=0.07, out_tol
     # (1) Check whether the closest beat to each annotation is inside the tolerance window...
     # NOTE: this will be difficult to ascertain for other evaluation methods.
     for i, ann in enumerate(annotations):
-        # find closest detection to current annotation ann
-        val = np.amin(np.abs(detections - ann))
-        ind = np.argmin(np.abs(detections - ann))
+        # closest detection to current annotation ann
+        ind = matching.closest_detection[i]
+        val = np.abs(detections[ind] - ann)
         if (val <= inn_tol_win):  # the detection is inside the tolerance window
             # Mark it as "good detection"
             operations[ind, 1] = 1
@@ -135,28 +342,26 @@ def operation_count(detections=None, annotations=None, inn_tol_win=0.07, out_tol
     operations[np.nonzero(operations[:, 1:].sum(axis=1) == 0), 3:] = 1
 
     # (3) Determine which shifts and qualify the shift
+    # the detections inside the outer window of each annotation are detections[shift_win_lo:shift_win_hi]
+    shift_win_lo = np.searchsorted(detections, annotations - out_tol_win, 'left')
+    shift_win_hi = np.searchsorted(detections, annotations + out_tol_win, 'right')
     for i, ann in enumerate(annotations):
         # look at the unaccounted for annotations
         if (annotations_accounted_for[i] == 0):
-            out_tol_win_min = ann - out_tol_win
-            out_tol_win_max = ann + out_tol_win
             # get the set of detections inside the window
-            dets_idx_in_shift_window, = np.nonzero((detections >= out_tol_win_min) & (detections <= out_tol_win_max))
+            dets_idx_in_shift_window = np.arange(shift_win_lo[i], shift_win_hi[i])
             # over this set, we remove any detection that is
             # already accounted as a good detection
-            # FIXME: Vectorised
-            idx_to_remove = []
-            for j, det in enumerate(dets_idx_in_shift_window):
-                if (operations[det, 1] == 1) or (detections_accounted_for[det] == 1):
-                    idx_to_remove.append(j)
+            to_remove = ((operations[dets_idx_in_shift_window, 1] == 1) |
+                         (detections_accounted_for[dets_idx_in_shift_window] == 1))
             # Clear marking for removals
-            dets_idx_in_shift_window = np.delete(dets_idx_in_shift_window, idx_to_remove)
+            dets_idx_in_shift_window = dets_idx_in_shift_window[~to_remove]
             # find whichever unaccounted for detections is closest and mark this is a shift
             # FIXME: count_shift_to_treat
             count_shift_to_treat = len(dets_idx_in_shift_window)
             if count_shift_to_treat > 0:
                 # Which is the closest detection the the current annotation ann
-                dist = [ann - detections[det_idx] for det_idx in dets_idx_in_shift_window]
+                dist = ann - detections[dets_idx_in_shift_window]
                 idx_closest = np.argmin(np.abs(dist))
                 if not detections_accounted_for[dets_idx_in_shift_window[idx_closest]]:
                     # it's not a deletion
@@ -179,10 +384,11 @@ def operation_count(detections=None, annotations=None, inn_tol_win=0.07, out_tol
     operations[np.nonzero(operations[:, 3:].sum(axis=1) == 2), 4] = 0
 
     # (5) Unnacounted annotations become insertions
-    for i, ann in enumerate(annotations):
-        if annotations_accounted_for[i] == 0:
-            new_row = np.array([ann, 0., 1., 0., 0.])
-            operations = np.vstack((operations, new_row))
+    insertions = annotations[annotations_accounted_for == 0]
+    new_rows = np.zeros(shape=(len(insertions), 5))
+    new_rows[:, 0] = insertions
+    new_rows[:, 2] = 1
+    operations = np.vstack((operations, new_rows))
 
     # Error checking
     if double_check_accounted(detections_accounted_for, annotations_accounted_for):
@@ -2,15 +2,23 @@
 This module contains all plotting functionality.
 To use within Python Scripts
 
+Note: this is the only module importing matplotlib (and IPython, only when already loaded),
+so it's not imported by the (NumPy only) core of the package.
+
 """
+from bisect import bisect_left, bisect_right
+import sys
 
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.patches as patches
+from matplotlib.artist import Artist, allow_rasterization
 from matplotlib.collections import LineCollection
 from matplotlib.legend_handler import HandlerTuple
+from matplotlib.text import Annotation, Text
 import matplotlib.transforms as transforms
-from IPython.core.getipython import get_ipython
+
+from modules.operating import detail_operations, local_annotation_efficiency
 
 # Control Definitions
 
@@ -32,6 +40,11 @@ D_OUT_WIN = True    # Draw Outer Tolerance Window
 D_LEGEND = True     # Draw Legend
 D_ARROWS = True     # Draw Shift Arrows
 
+# Duration (in seconds) of the blocks of beats updated by OperationsView
+BLOCK_DURATION = 10.0
+# Width (in pixels) around the changed interval redrawn by OperationsView (for the SID labels)
+LABEL_PAD = 20
+
 # SID Labels
 SHI_char = 'S'      # Label for Shifts
 INS_char = 'I'      # Label for Insertions
@@ -66,20 +79,6 @@ class HandlerTupleVertical(HandlerTuple):
         return leglines
 
 
-def detail_operations(ops):
-    """Gets the list of operations and indexes from the full operations matrix."""
-    idx_shi = np.where(ops[:, 4] != 0)[0]
-    idx_ins = np.where(ops[:, 2] == 1)[0]
-    idx_del = np.where(ops[:, 3] == 1)[0]
-    lst_det = ops[ops[:, 1] == 1, 0]
-    lst_ins = ops[ops[:, 2] == 1, 0]
-    lst_del = ops[ops[:, 3] == 1, 0]
-    shi_res = ops[idx_shi, 0] + ops[idx_shi, 4]
-    un_shi = ops[idx_shi, 0]
-
-    return lst_det, lst_ins, lst_del, shi_res, un_shi, idx_shi, idx_ins, idx_del
-
-
 def draw_SID_labels(ax, ops, idx_SHI=None, idx_INS=None, idx_DEL=None, plot_type='subplots'):
     """Draws the labels for Shift, Insert, Delete"""
     fontsize = 'smaller'
@@ -94,21 +93,23 @@ def draw_SID_labels(ax, ops, idx_SHI=None, idx_INS=None, idx_DEL=None, plot_type
     # the x coords of this transformation are data, and the y coord are axes
     trans = transforms.blended_transform_factory(ax.transData, ax.transAxes)
 
+    labels = []
     for idx, det in enumerate(ops):
         if idx in idx_INS:
-            ax.annotate(INS_char, xy=(det, Y_pos), xycoords=trans, bbox=bbox_ins, xytext=(0, 0),
-                        textcoords='offset points', ha='center', size=fontsize)
+            labels.append(ax.annotate(INS_char, xy=(det, Y_pos), xycoords=trans, bbox=bbox_ins, xytext=(0, 0),
+                                      textcoords='offset points', ha='center', size=fontsize))
         elif idx in idx_DEL:
-            ax.annotate(DEL_char, xy=(det, Y_pos), xycoords=trans, bbox=bbox_del, xytext=(0, 0),
-                        textcoords='offset points', ha='center', size=fontsize)
+            labels.append(ax.annotate(DEL_char, xy=(det, Y_pos), xycoords=trans, bbox=bbox_del, xytext=(0, 0),
+                                      textcoords='offset points', ha='center', size=fontsize))
         elif idx in idx_SHI:
-            ax.annotate(SHI_char, xy=(det, Y_pos), xycoords=trans, bbox=bbox_shi, xytext=(0, 0),
-                        textcoords='offset points', ha='center', size=fontsize)
-    return True
+            labels.append(ax.annotate(SHI_char, xy=(det, Y_pos), xycoords=trans, bbox=bbox_shi, xytext=(0, 0),
+                                      textcoords='offset points', ha='center', size=fontsize))
+    return labels
 
 
 def draw_outer_tolerance_window(ax, annotations, idx_shifts, window=1):
     """Draws the outer tolerance window around annotations"""
+    rects = []
     for idx, ann in enumerate(annotations):
         if idx in idx_shifts:
             window_left = ann - window
@@ -116,7 +117,8 @@ def draw_outer_tolerance_window(ax, annotations, idx_shifts, window=1):
             rect = patches.Rectangle(xy=(window_left, 0), width=window_right-window_left, height=1,
                                      edgecolor='None', facecolor=col_dict.get('Shifts'), alpha=0.3)
             ax.add_patch(rect)
-    return True
+            rects.append(rect)
+    return rects
 
 
 def draw_inner_tolerance_window(ax, annotations, window=0.07):
@@ -130,6 +132,36 @@ def draw_inner_tolerance_window(ax, annotations, window=0.07):
     return True
 
 
+def draw_shift_arrows(ax, un_shifted, shift_result):
+    """Draws the arrows from the unshifted detections to the shift results"""
+    arrows = []
+    for un_shi, shi_res in zip(un_shifted, shift_result):
+        arrows.append(ax.annotate("", xy=(shi_res, -0.5), xycoords='data',
+                                  xytext=(un_shi, -0.5), textcoords='data',
+                                  arrowprops=dict(arrowstyle="->", color=col_dict.get('Shifts'), linestyle='dashdot')))
+    return arrows
+
+
+def draw_local_efficiency(ax, operations, window=10.0, hop=1.0):
+    """Draws the local annotation efficiency (and number of operations) over sliding windows"""
+    times, ae, _, n_insertions, n_deletions, n_shifts = local_annotation_efficiency(operations, window, hop)
+
+    lines = ax.plot(times, ae, color=col_dict.get('Detections'))
+    labels = [f'Annot. eff. ({window:g}s win.)']
+    ax.set(ylim=(0, 1.05), xlabel='time (s)')
+
+    # number of operations on a secondary axis
+    ax_counts = ax.twinx()
+    for counts, label in zip((n_insertions, n_deletions, n_shifts), ('Insertions', 'Deletions', 'Shifts')):
+        lines += ax_counts.plot(times, counts, color=col_dict.get(label), linestyle=lin_dict.get(label))
+        labels.append(f'# {label}')
+    ax_counts.set_ylim(bottom=0)
+
+    if D_LEGEND:
+        ax.legend(lines, labels, bbox_to_anchor=(1.06, 0.5), loc='center left', borderaxespad=0)
+    return lines
+
+
 def get_segment(positions, plot_type):
     """
     Gets a line segment in (x,y) coords (required for linecollection) from a list of x positions
@@ -230,7 +262,10 @@ def add_line_collections(ax_upper, ax_lower, labels_upper, labels_lower, items_u
 
 
 def isnotebook():
+    if 'IPython' not in sys.modules:
+        return False      # IPython isn't running (and importing it is slow)
     try:
+        from IPython.core.getipython import get_ipython
         shell = get_ipython().__class__.__name__
         if shell == 'ZMQInteractiveShell':
             return True   # Jupyter notebook or qtconsole
@@ -242,7 +277,8 @@ def isnotebook():
         return False      # Probably standard Python interpreter
 
 
-def plot_operations(operations, annotations, title='', inn_tol_win=0.07, out_tol_win=1.0, plot_type='subplots'):
+def plot_operations(operations, annotations, title='', inn_tol_win=0.07, out_tol_win=1.0, plot_type='subplots',
+                    return_artists=False, local_window=None, local_hop=1.0, operation_artists=True):
     """
     Produces the matplotlib figure to be rendered.
 
@@ -271,10 +307,30 @@ def plot_operations(operations, annotations, title='', inn_tol_win=0.07, out_tol
             (default) 'subplots': 2 subplots with annotations on upper axis and operations on lower axis
                         'single': single subplot with annotations and operations on same axis
 
+    return_artists: bool (optional)
+        also return the dict of drawn artists (used to update the figure in place)
+        (Default value = False)
+
+    local_window: float (optional)
+        if given, adds a panel (as last axis) with the local annotation efficiency over sliding windows
+        of this duration in seconds (see local_annotation_efficiency)
+        (Default value = None)
+
+    local_hop: float (optional)
+        hop between the sliding windows in seconds
+        (Default value = 1)
+
+    operation_artists: bool (optional)
+        draw the SID labels, outer tolerance windows and shift arrows (OperationsView draws them itself)
+        (Default value = True)
+
     Returns
     -------
     fig: matplotlib figure
     ax: matplotlib axis
+    artists: dict (only if return_artists)
+        'lines_upper', 'lines_lower': line collections (as in the legend)
+        'labels': SID labels, 'outer_windows': outer tolerance windows, 'arrows': shift arrows
     """
 
     # Default Settings
@@ -287,14 +343,22 @@ def plot_operations(operations, annotations, title='', inn_tol_win=0.07, out_tol
         fs_single = (11, 2)
         fs_subplots = (11, 3)
 
+    # extra panel for the local annotation efficiency
+    n_local = 0 if local_window is None else 1
+    fs_single = (fs_single[0], fs_single[1] + n_local)
+    fs_subplots = (fs_subplots[0], fs_subplots[1] + n_local)
+
     if plot_type == 'subplots':
-        fig, ax = plt.subplots(2, figsize=fs_subplots, dpi=100, sharex=True)
+        fig, ax = plt.subplots(2 + n_local, figsize=fs_subplots, dpi=100, sharex=True)
         ax_upper = ax[0]
         ax_lower = ax[1]
+    elif n_local:
+        fig, ax = plt.subplots(1 + n_local, figsize=fs_single, dpi=100, sharex=True)
+        ax_upper = ax_lower = ax[0]
     else:
         fig, ax = plt.subplots(figsize=fs_single, dpi=100)
         ax_upper = ax_lower = ax
-    fig.canvas.set_window_title(title)
+    fig.canvas.manager.set_window_title(title)
 
     detections, insertions, deletions, shift_result, un_shifted, idx_shifts, idx_insertions,\
         idx_deletions = detail_operations(operations)
@@ -304,9 +368,12 @@ def plot_operations(operations, annotations, title='', inn_tol_win=0.07, out_tol
     lines_upper = [annotations]
     labels_upper = ['Annotations']
 
+    artists = {'labels': [], 'outer_windows': [], 'arrows': []}
+
     # draw the SID (Shift, Insert, Delete) labels
-    if D_SID:
-        draw_SID_labels(ax_lower, operations[:, 0], idx_shifts, idx_insertions, idx_deletions, plot_type)
+    if D_SID and operation_artists:
+        artists['labels'] = draw_SID_labels(ax_lower, operations[:, 0], idx_shifts, idx_insertions, idx_deletions,
+                                            plot_type)
 
     # draw the inner tolerance window
     if D_INN_WIN:
@@ -317,7 +384,9 @@ def plot_operations(operations, annotations, title='', inn_tol_win=0.07, out_tol
 
     # draw the outer tolerance window (for shifts)
     if D_OUT_WIN:
-        draw_outer_tolerance_window(ax_upper, annotations, idx_shifts_per_annotation, out_tol_win)
+        if operation_artists:
+            artists['outer_windows'] = draw_outer_tolerance_window(ax_upper, annotations, idx_shifts_per_annotation,
+                                                                   out_tol_win)
         outer_tolerance_patch = patches.Patch(facecolor=col_dict.get('Shifts'), edgecolor='None', alpha=0.3)
         lines_upper.append(outer_tolerance_patch)
         labels_upper.append(f'Outer tol. win.:$\\pm${out_tol_win}s')
@@ -329,6 +398,8 @@ def plot_operations(operations, annotations, title='', inn_tol_win=0.07, out_tol
     # add LineCollections
     lines_upper, lines_lower = add_line_collections(
         ax_upper, ax_lower, labels_upper, labels_lower, lines_upper, lines_lower)
+    artists['lines_upper'] = list(lines_upper)
+    artists['lines_lower'] = list(lines_lower)
 
     if D_LEGEND:
         if plot_type == 'subplots':
@@ -352,10 +423,381 @@ def plot_operations(operations, annotations, title='', inn_tol_win=0.07, out_tol
         ax_lower.set(ylim=(-1, 1), yticks=[], xlabel='time (s)')
     ax_lower.set_xlim(left=0)
 
-    if D_ARROWS:
-        for i, shift_ind in enumerate(idx_shifts):
-            ax_lower.annotate("", xy=(shift_result[i], -0.5), xycoords='data',
-                              xytext=(operations[shift_ind, 0], -0.5), textcoords='data',
-                              arrowprops=dict(arrowstyle="->", color=col_dict.get('Shifts'), linestyle='dashdot'))
+    if D_ARROWS and operation_artists:
+        artists['arrows'] = draw_shift_arrows(ax_lower, un_shifted, shift_result)
+
+    if n_local:
+        ax_lower.set(xlabel='')
+        artists['local'] = draw_local_efficiency(ax[-1], operations, local_window, local_hop)
+
+    if return_artists:
+        return fig, ax, artists
 
     return fig, ax
+
+
+class ArtistBlock(Artist):
+    """
+    Artists of a block of time (e.g. the SID labels), drawn as a single child of an axis, so that they can be
+    replaced without searching the (many) children of the axis. Stands in for the axis in the draw_* functions.
+    """
+
+    def __init__(self, ax, zorder=1):
+        super().__init__()
+        self.ax = ax
+        self.transData, self.transAxes = ax.transData, ax.transAxes
+        self.set_figure(ax.figure)
+        self.set_zorder(zorder)
+        self.times = []
+        self.artists = []
+
+    def annotate(self, text, xy, **kwargs):
+        """As Axes.annotate."""
+        annotation = Annotation(text, xy, **kwargs)
+        annotation.set_transform(transforms.IdentityTransform())
+        return self._add(annotation)
+
+    def add_patch(self, patch):
+        """As Axes.add_patch (without updating the data limits)."""
+        if patch.get_clip_path() is None:
+            patch.set_clip_path(self.ax.patch)
+        return self._add(patch)
+
+    def _add(self, artist):
+        artist.set_figure(self.figure)
+        artist.axes = self.ax
+        if not artist.is_transform_set():
+            artist.set_transform(self.ax.transData)
+        self.artists.append(artist)
+        return artist
+
+    def replace(self, start, end, times, artists):
+        """Replaces the artists with a time inside [start, end] by new ones (sorted by time)."""
+        first, last = bisect_left(self.times, start), bisect_right(self.times, end)
+        for artist in artists:
+            artist.set_animated(self.get_animated())
+        self.times[first:last] = times
+        self.artists[first:last] = artists
+        self.stale = True
+
+    def set_animated(self, b):
+        super().set_animated(b)
+        for artist in self.artists:
+            artist.set_animated(b)
+
+    def get_children(self):
+        return list(self.artists)
+
+    def get_window_extent(self, renderer=None):
+        if not self.artists:
+            return transforms.Bbox.null()
+        return transforms.Bbox.union([artist.get_window_extent(renderer) for artist in self.artists])
+
+    @allow_rasterization
+    def draw(self, renderer):
+        if self.get_visible():
+            for artist in self.artists:
+                artist.draw(renderer)
+        self.stale = False
+
+
+class OperationsView:
+    """
+    Figure produced by plot_operations, that can be updated in place after (local) changes of the operations.
+
+    The beats (line collections), SID labels, shift arrows and outer tolerance windows are drawn in blocks
+    (of BLOCK_DURATION seconds), so that an update only replaces the blocks around the changed interval.
+    With backends supporting blitting, these artists are animated: each full draw keeps the figure without
+    them as background (and then draws them), and an update only redraws the region of the canvas around
+    the changed interval over this background.
+    """
+
+    def __init__(self, operations, annotations, title='', inn_tol_win=0.07, out_tol_win=1.0, plot_type='subplots'):
+        self.annotations = np.asarray(annotations)
+        self.out_tol_win = out_tol_win
+        self.plot_type = plot_type
+        self.fig, self.ax, artists = plot_operations(operations, annotations, title, inn_tol_win, out_tol_win,
+                                                     plot_type, return_artists=True, operation_artists=False)
+        if plot_type == 'subplots':
+            self.ax_upper, self.ax_lower = self.ax
+        else:
+            self.ax_upper = self.ax_lower = self.ax
+        self.axes = list(dict.fromkeys((self.ax_upper, self.ax_lower)))
+        self._blit = self.fig.canvas.supports_blit
+
+        # order in which the artists were added (the axes draw them by zorder, then in this order)
+        self._order = {}
+        # artists drawn over the operations, that don't change: horizontal line, spines and legends
+        self.static = {ax: list(ax.lines) + list(ax.spines.values()) + ([ax.get_legend()] if ax.get_legend() else [])
+                       for ax in self.axes}
+        for ax, static in self.static.items():
+            for line in ax.lines:
+                # (over the blocks of beats, as plot_operations adds it after the beats)
+                line.set_zorder(line.get_zorder() + 0.1)
+            self._add_order(ax.lines)
+            for artist in static:
+                artist.set_animated(self._blit)
+
+        # kinds of artists drawn in blocks: kind -> (axis, zorder); the line collections are styled as
+        # their (emptied) line collection drawn by plot_operations (still used by the legend)
+        lc_detections, lc_insertions, lc_deletions, (lc_un_shifted, lc_shift_result) = artists['lines_lower']
+        self.templates = {'Annotations': artists['lines_upper'][0],
+                          'Detections': lc_detections,
+                          'Insertions': lc_insertions,
+                          'Deletions': lc_deletions,
+                          'Un-shifted': lc_un_shifted,
+                          'Shift results': lc_shift_result}
+        self.kinds = {kind: (self.ax_upper if kind == 'Annotations' else self.ax_lower, template.get_zorder())
+                      for kind, template in self.templates.items()}
+        self.kinds.update({'labels': (self.ax_lower, Annotation.zorder),
+                           'arrows': (self.ax_lower, Annotation.zorder),
+                           'outer_windows': (self.ax_upper, patches.Rectangle.zorder)})
+        # kind -> {block: line collection or ArtistBlock}
+        self.blocks = {kind: {} for kind in self.kinds}
+
+        self._set_blocks('Annotations', self.annotations)
+        for kind, positions in zip(list(self.templates)[1:], self._positions(operations)):
+            self._set_blocks(kind, positions)
+        for template in self.templates.values():
+            template.set_segments([])
+        self._draw_operations(operations, -np.inf, np.inf)
+
+        # background of the figure without the animated artists (captured by each full draw)
+        self._background = None
+        self.fig.canvas.mpl_connect('draw_event', self._on_draw)
+
+    def _add_order(self, artists):
+        for artist in artists:
+            self._order[artist] = len(self._order)
+
+    @staticmethod
+    def _positions(operations):
+        """Positions of the lower line collections (detections, insertions, deletions, un-shifted, shift results)."""
+        detections, insertions, deletions, shift_result, un_shifted, _, _, _ = detail_operations(operations)
+        return detections, insertions, deletions, un_shifted, shift_result
+
+    def _new_block(self, kind, block, artist):
+        """Adds the artist of a new block to its axis."""
+        ax, _ = self.kinds[kind]
+        artist.set_animated(self._blit)
+        if isinstance(artist, LineCollection):
+            ax.add_collection(artist, autolim=False)
+        else:
+            ax.add_artist(artist)
+        self._add_order([artist])
+        self.blocks[kind][block] = artist
+
+    def _set_blocks(self, kind, positions, first=None, last=None):
+        """Sets the line collections of the blocks [first, last] (all the blocks of the positions if None)."""
+        template = self.templates[kind]
+        segment_type = 'upper' if kind == 'Annotations' else 'lower'
+        positions = np.sort(positions)
+        blocks = np.floor(positions / BLOCK_DURATION).astype(int)
+        if first is None:
+            first, last = (blocks[0], blocks[-1]) if len(blocks) > 0 else (0, -1)
+        for block in range(first, last + 1):
+            lo, hi = np.searchsorted(blocks, block, 'left'), np.searchsorted(blocks, block, 'right')
+            segments = get_segment(positions[lo:hi], segment_type)
+            if block in self.blocks[kind]:
+                self.blocks[kind][block].set_segments(segments)
+            elif segments:
+                self._new_block(kind, block, LineCollection(segments, colors=template.get_colors(),
+                                                            linestyles=template.get_linestyles(),
+                                                            zorder=template.get_zorder()))
+
+    def _staging(self, kind):
+        """Block (not added to the axis) in which new artists of a kind are drawn, before _replace."""
+        ax, zorder = self.kinds[kind]
+        return ArtistBlock(ax, zorder)
+
+    def _replace(self, kind, start, end, times, artists):
+        """
+        Replaces the artists of a kind with a time inside [start, end] by new ones, in the blocks of
+        [start, end] (or of the new artists, if unbounded).
+        """
+        times = np.asarray(times, dtype=float)
+        order = np.argsort(times, kind='stable')
+        times, artists = times[order], [artists[i] for i in order]
+        blocks = np.floor(times / BLOCK_DURATION).astype(int)
+        if np.isfinite(start) and np.isfinite(end):
+            span = range(int(np.floor(start / BLOCK_DURATION)), int(np.floor(end / BLOCK_DURATION)) + 1)
+        else:
+            span = np.unique(blocks)
+        for block in span:
+            lo, hi = np.searchsorted(blocks, block, 'left'), np.searchsorted(blocks, block, 'right')
+            if block not in self.blocks[kind]:
+                if lo == hi:
+                    continue
+                self._new_block(kind, block, self._staging(kind))
+            self.blocks[kind][block].replace(start, end, list(times[lo:hi]), artists[lo:hi])
+
+    def _draw_operations(self, operations, start, end):
+        """Draws the SID labels, shift arrows and outer tolerance windows of the operations inside [start, end]."""
+        changed = operations[(operations[:, 0] >= start) & (operations[:, 0] <= end)]
+        _, _, _, shi_res, un_shi, idx_shi, idx_ins, idx_del = detail_operations(changed)
+
+        if D_SID:
+            labels = draw_SID_labels(self._staging('labels'), changed[:, 0], idx_shi, idx_ins, idx_del,
+                                     self.plot_type)
+            self._replace('labels', start, end, [label.xy[0] for label in labels], labels)
+
+        if D_ARROWS:
+            self._replace('arrows', start, end, un_shi, draw_shift_arrows(self._staging('arrows'), un_shi, shi_res))
+
+        if D_OUT_WIN:
+            # the shifted detections of the changed annotations are inside their outer tolerance window
+            annotations = self.annotations[(self.annotations >= start) & (self.annotations <= end)]
+            around = operations[(operations[:, 0] >= start - self.out_tol_win) &
+                                (operations[:, 0] <= end + self.out_tol_win)]
+            _, _, _, around_shi_res, _, _, _, _ = detail_operations(around)
+            idx_windows = sorted(set(get_shift_indices_from_annotations(annotations, around_shi_res)))
+            windows = draw_outer_tolerance_window(self._staging('outer_windows'), annotations, idx_windows,
+                                                  self.out_tol_win)
+            self._replace('outer_windows', start, end, annotations[idx_windows], windows)
+
+    def interval(self, start, end):
+        """
+        Time interval of the operations update needs after a change inside [start, end]:
+        the blocks of the interval, and the shifts (and their windows) reaching them.
+        """
+        first = np.floor(start / BLOCK_DURATION) * BLOCK_DURATION
+        last = (np.floor(end / BLOCK_DURATION) + 1) * BLOCK_DURATION
+        return first - self.out_tol_win, last + self.out_tol_win
+
+    def update(self, operations, start, end):
+        """
+        Updates the figure after the operations changed inside the [start, end] time interval.
+
+        Parameters
+        ----------
+        operations : nparray
+            (updated) operations, at least the rows inside interval(start, end).
+        start : float
+            start of the changed time interval in seconds.
+        end : float
+            end of the changed time interval in seconds.
+        """
+        first, last = int(np.floor(start / BLOCK_DURATION)), int(np.floor(end / BLOCK_DURATION))
+        for kind, positions in zip(list(self.templates)[1:], self._positions(operations)):
+            self._set_blocks(kind, positions, first, last)
+        self._draw_operations(operations, start, end)
+
+        self._redraw(start, end)
+
+    def _pad(self):
+        """Width of LABEL_PAD pixels, in data coords."""
+        x_min, x_max = self.ax_lower.get_xlim()
+        return LABEL_PAD * (x_max - x_min) / max(self.ax_lower.bbox.width, 1)
+
+    def _sorted(self, artists):
+        """The artists of each axis in drawing order."""
+        return {ax: sorted(ax_artists, key=lambda artist: (artist.get_zorder(), self._order.get(artist, -1)))
+                for ax, ax_artists in artists.items()}
+
+    def _region_artists(self, start, end, region):
+        """
+        Animated artists reaching the [start, end] interval (region of the canvas), per axis, in drawing order.
+        """
+        pad = self._pad()
+        reach = {kind: pad if kind in self.templates or kind == 'labels' else self.out_tol_win + pad
+                 for kind in self.kinds}
+
+        artists = {ax: [] for ax in self.axes}
+        for kind, (ax, _) in self.kinds.items():
+            first = int(np.floor((start - reach[kind]) / BLOCK_DURATION))
+            last = int(np.floor((end + reach[kind]) / BLOCK_DURATION))
+            artists[ax] += [self.blocks[kind][block] for block in range(first, last + 1) if block in self.blocks[kind]]
+        for ax in self.axes:
+            artists[ax] += [artist for artist in self.static[ax] if artist is not ax.get_legend() or
+                            self._legend_overlaps(ax, region)]
+        return self._sorted(artists)
+
+    def _animated_artists(self):
+        """All the animated artists, per axis, in drawing order."""
+        artists = {ax: list(self.static[ax]) for ax in self.axes}
+        for kind, (ax, _) in self.kinds.items():
+            artists[ax] += list(self.blocks[kind].values())
+        return self._sorted(artists)
+
+    def _on_draw(self, event):
+        """Keeps the background drawn by a full draw (e.g. after zooming), and draws the animated artists."""
+        canvas = self.fig.canvas
+        if not self._blit or canvas.is_saving():
+            # (saving draws the animated artists, possibly at another resolution)
+            self._background = None
+            return
+        self._background = canvas.copy_from_bbox(self.fig.bbox)
+        for artists in self._animated_artists().values():
+            for artist in artists:
+                self.fig.draw_artist(artist)
+
+    def _redraw(self, start, end):
+        """Redraws (and blits) the region of the canvas around [start, end]."""
+        canvas = self.fig.canvas
+        if not self._blit or self._background is None:
+            # (the next full draw keeps the background)
+            canvas.draw_idle()
+            return
+
+        # region of the canvas: the (visible) time interval reached by the changed artists, whole figure height
+        reach = self.out_tol_win + self._pad()
+        left, right = self.ax_lower.transData.transform([(start - reach, 0), (end + reach, 0)])[:, 0]
+        left, right = np.floor(left), np.ceil(right)
+        # (labels past the axes edges are drawn in the figure margins)
+        to_data = self.ax_lower.transData.inverted()
+        if left <= self.ax_lower.bbox.x0:
+            left = self.fig.bbox.x0
+            start = min(start, to_data.transform((left, 0))[0])
+        if right >= self.ax_lower.bbox.x1:
+            right = self.fig.bbox.x1
+            end = max(end, to_data.transform((right, 0))[0])
+        if right <= left:
+            return
+        region = transforms.Bbox.from_extents(left, self.fig.bbox.y0, right, self.fig.bbox.y1)
+        # (legends are not clipped, the region takes them whole)
+        for ax in self.axes:
+            if self._legend_overlaps(ax, region):
+                extent = ax.get_legend().get_window_extent()
+                left, right = min(left, np.floor(extent.x0) - 1), max(right, np.ceil(extent.x1) + 1)
+        region = transforms.Bbox.from_extents(left, self.fig.bbox.y0, right, self.fig.bbox.y1)
+
+        # (the restored columns include the right one, which the clipped drawing excludes)
+        canvas.restore_region(self._background, bbox=(left, self.fig.bbox.y0, right - 1, self.fig.bbox.y1),
+                              xy=(self.fig.bbox.x0, self.fig.bbox.y0))
+        for artists in self._region_artists(start - reach, end + reach, region).values():
+            for artist in artists:
+                self._draw_clipped(artist, region)
+        canvas.blit(region)
+
+    @staticmethod
+    def _legend_overlaps(ax, region):
+        """Whether the legend of an axis (if any) overlaps a region of the canvas."""
+        legend = ax.get_legend()
+        if legend is None:
+            return False
+        extent = legend.get_window_extent()
+        return extent.x0 < region.x1 and region.x0 < extent.x1
+
+    @staticmethod
+    def _clipped_parts(artist):
+        """The artist, or the artists of a block, and the arrow and box patches of annotations."""
+        if isinstance(artist, ArtistBlock):
+            return [part for child in artist.artists for part in OperationsView._clipped_parts(child)]
+        if isinstance(artist, Text):
+            return [artist] + [patch for patch in (getattr(artist, 'arrow_patch', None), artist.get_bbox_patch())
+                               if patch]
+        return [artist]
+
+    def _draw_clipped(self, artist, region):
+        """Draws an artist clipped to a region of the canvas."""
+        parts = self._clipped_parts(artist)
+        clips = [(part.get_clip_box(), part.get_clip_on()) for part in parts]
+        for part, (clip_box, clip_on) in zip(parts, clips):
+            clip = transforms.Bbox.intersection(region, clip_box) if clip_on and clip_box else region
+            # (an empty clip box, if the part is clipped outside the region)
+            part.set_clip_box(clip or transforms.Bbox.from_extents(region.x0, region.y0, region.x0, region.y0))
+            part.set_clip_on(True)
+        self.fig.draw_artist(artist)
+        for part, (clip_box, clip_on) in zip(parts, clips):
+            part.set_clip_box(clip_box)
+            part.set_clip_on(clip_on)
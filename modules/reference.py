@@ -0,0 +1,456 @@
+"""
+This module contains frozen copies of the original implementations, used as the reference
+(oracle) by the differential harness (see modules.differential), and straightforward versions
+of the metrics that have no original implementation.
+
+Note: do NOT optimise or fix these functions, their exact behaviour (including the TIE_OFFSET
+tie-breaking, the greedy closest-detection choices and the np.delete ordering in f_measure)
+is what faster engines are checked against.
+
+"""
+import numpy as np
+
+from modules.utils import double_check_accounted
+
+
+def variations(sequence, offbeat=True, double=True, half=True,
+               triple=True, third=True):
+    """
+    Create variations of the given beat sequence.
+
+    Parameters
+    ----------
+    sequence : numpy array
+        Beat sequence.
+    offbeat : bool, optional
+        Create an offbeat sequence.
+    double : bool, optional
+        Create a double tempo sequence.
+    half : bool, optional
+        Create half tempo sequences (includes offbeat version).
+    triple : bool, optional
+        Create triple tempo sequence.
+    third : bool, optional
+        Create third tempo sequences (includes offbeat versions).
+
+    Returns
+    -------
+    sequences: list
+        Beat sequence variations.
+    type_sequences: list of str
+        Type of beat sequence variations.
+
+        ['Original',
+         'Offbeat',
+         'Double',
+         'Half-odd',
+         'Half-even',
+         'Triple',
+         'Third-1',
+         'Third-2',
+         'Third-3']
+    """
+    # Adapted from:
+    #
+    # https://github.com/CPJKU/madmom/blob/master/madmom/evaluation/beats.py
+    #
+    # Copyright (c) 2012-2014 Department of Computational Perception,
+    # Johannes Kepler University, Linz, Austria and Austrian Research Institute for
+    # Artificial Intelligence (OFAI), Vienna, Austria.
+    # All rights reserved.
+
+    # create different variants of the annotations
+    sequences = []
+    sequences.append(sequence)
+
+    # register the variants created
+    type_sequences = []
+    type_sequences.append('Original')
+
+    # double/half and offbeat variation
+    if double or offbeat:
+        if len(sequence) == 0:
+            # if we have an empty sequence, there's nothing to interpolate
+            double_sequence = []
+        else:
+            # create a sequence with double tempo
+            same = np.arange(0, len(sequence))
+            # request one item less, otherwise we would extrapolate
+            shifted = np.arange(0, len(sequence), 0.5)[:-1]
+            double_sequence = np.interp(shifted, same, sequence)
+        # same tempo, half tempo off
+        if offbeat:
+            sequences.append(double_sequence[1::2])
+            type_sequences.append('Offbeat')
+        # double/half tempo variations
+        if double:
+            # double tempo
+            sequences.append(double_sequence)
+            type_sequences.append('Double')
+    if half:
+        # half tempo odd beats (i.e. 1,3,1,3,..)
+        sequences.append(sequence[0::2])
+        type_sequences.append('Half-Odd')
+        # half tempo even beats (i.e. 2,4,2,4,..)
+        sequences.append(sequence[1::2])
+        type_sequences.append('Half-Even')
+    # triple/third tempo variations
+    if triple:
+        if len(sequence) == 0:
+            # if we have an empty sequence, there's nothing to interpolate
+            triple_sequence = []
+        else:
+            # create a annotation sequence with triple tempo
+            same = np.arange(0, len(sequence))
+            # request two items less, otherwise we would extrapolate
+            shifted = np.arange(0, len(sequence), 1. / 3)[:-2]
+            triple_sequence = np.interp(shifted, same, sequence)
+        # triple tempo
+        sequences.append(triple_sequence)
+        type_sequences.append('Triple')
+
+    if third:
+        # third tempo 1st beat (1,4,3,2,..)
+        sequences.append(sequence[0::3])
+        type_sequences.append('Third-1')
+        # third tempo 2nd beat (2,1,4,3,..)
+        sequences.append(sequence[1::3])
+        type_sequences.append('Third-2')
+        # third tempo 3rd beat (3,2,1,4,..)
+        sequences.append(sequence[2::3])
+        type_sequences.append('Third-3')
+    # return
+    return sequences, type_sequences
+
+
+def f_measure(annotations, detections, inn_tol_win=0.07):
+    """
+    Calculates the F-measure as used in (Dixon, 2006) and (Dixon, 2007).
+
+    @param anns sequence of ground truth beat annotations (in seconds)
+    @param beats sequence of estimated beat times (in seconds)
+
+    @returns f - the F-measure
+    """
+    # Adapted from:
+    #
+    # https://github.com/adamstark/Beat-Tracking-Evaluation-Toolbox/blob/master/beat_evaluation_toolbox.py
+    #
+    # (c) 2009 Matthew Davies
+    # Python implementation by Adam Stark 2011-2012
+
+    minBeatTime = 0
+
+    # remove detections and annotations that are within the first 5 seconds
+    annotations = annotations[np.where(annotations >= minBeatTime)]
+    detections = detections[np.where(detections >= minBeatTime)]
+
+    # number of false positives
+    fp = 0
+
+    # number of false negatives
+    fn = 0
+
+    # number of correct detections
+    hits = 0
+
+    # Check if there are any detections, if not then exit
+    if detections.size == 0:
+        print("beat sequence is empty, assigning zero to all outputs [f,p,r,a]")
+        f = 0
+        return f
+
+    # get the threshold parameter for the tolerance window
+    delta = inn_tol_win
+
+    for i in range(annotations.size):
+        # set up range of tolerance window
+        windowMin = annotations[i] - delta
+        windowMax = annotations[i] + delta
+
+        # find those detections which are in the range of the tolerance window
+        # [a1,a2,a3] = find(and(detections>=windowMin, detections<=windowMax));
+        detectionsinwindow = []
+        detectionstoadd = []
+        for j in range(detections.size):
+            if (detections[j] >= windowMin) and (detections[j] <= windowMax):
+                detectionstoadd.append(j)
+
+        # now remove these detections so it can't be counted again
+        for k in range(len(detectionstoadd)):
+            detectionsinwindow.append(detectionstoadd[k])
+            detections = np.delete(detections, detectionstoadd[k])
+
+        if (len(detectionsinwindow) == 0):      # no detections in window, therefore it's a false negative
+            fn = fn + 1
+        elif(len(detectionsinwindow) > 1):       # false positive case, more than one beat in a tolerance window
+            hits = hits+1
+            fp = fp + 1
+        else:                               # only one beat in the tolerance window therefore a correct detection
+            hits = hits+1
+
+    # add any remaining detections to the number of false positives
+    fp = fp + detections.size
+
+    # calculate precision, p
+    if ((hits + fp) > 0):
+        p = (hits / (hits+fp))
+    else:
+        p = 0
+
+    # calculate recall, r
+    if ((hits + fn) > 0):
+        r = ((hits)/(hits+fn))
+    else:
+        r = 0
+
+    # now calculate the f-measure
+    if ((p + r) > 0):
+        f = 2 * p*r/(p+r)
+    else:
+        f = 0
+
+    return f
+
+
+def annotation_efficiency(operations=None):
+    """
+    Calculates the annotation efficiency and stats
+
+    Parameters
+    ----------
+    operations : list
+        list of operations.
+
+    Returns
+    -------
+    ae: float
+        annotation efficiency
+    n_detections: int
+        number of (correct) detections
+    n_insertions: int
+        number of (correct) insertions
+    n_deletions: int
+        number of (correct) deletions
+    n_shifts: int
+        number of (correct) shifts
+
+    """
+    n_insertions = np.sum(operations[:, 2])
+    n_deletions = operations[:, 3].sum()
+    n_shifts = np.count_nonzero(operations[:, 4], axis=0)
+    n_detections = operations[:, 1].sum()
+    ae = n_detections / (n_detections + n_insertions + n_deletions + n_shifts)
+
+    return ae, n_detections, n_insertions, n_deletions, n_shifts
+
+
+def process_operations(operations=None):
+    """ returns the transformed detections """
+    ops = np.array(operations[np.where(operations[:, 3] != 1)], copy=True)
+    transformed = ops[:, 0] + ops[:, 4]
+    transformed = np.sort(transformed)
+
+    return transformed
+
+
+def operation_count(detections=None, annotations=None, inn_tol_win=0.07, out_tol_win=1.0):
+    """
+    Counts the number of operations necessary to maximise the F-measure.
+
+
+    Parameters
+    ----------
+    detections : list
+        list of detections.
+    annotations : list
+        list of annotations.
+    inn_tol_win : float
+        inner tolerance window in seconds
+        (default value=0.07)
+    out_tol_win : float
+        outer tolerance window in seconds
+        (default value=1)
+
+    Returns
+    -------
+    operations: nparray
+        matrix of operations required to transform detections.
+    ae: float
+        annotation efficiency.
+    """
+    if (annotations.size < 1) and (detections.size < 1):
+        print('both the detections and annotations are empty, job done')
+        operations = []
+        ann_efficiency = 1
+        return operations, ann_efficiency
+
+    # to prevent a detection falling exactly midway between two annotations
+    detections = np.sort(detections) + 1e-7
+    annotations = np.sort(annotations)
+
+    annotations_accounted_for = np.zeros(len(annotations))  # mark already used annotations
+    detections_accounted_for = np.zeros(len(detections))  # mark already used detections
+    operations = np.zeros(shape=(len(detections), 5))
+    # populate the first column
+    operations[:, 0] = detections
+
+    # (1) Check whether the closest beat to each annotation is inside the tolerance window...
+    # NOTE: this will be difficult to ascertain for other evaluation methods.
+    for i, ann in enumerate(annotations):
+        # find closest detection to current annotation ann
+        val = np.amin(np.abs(detections - ann))
+        ind = np.argmin(np.abs(detections - ann))
+        if (val <= inn_tol_win):  # the detection is inside the tolerance window
+            # Mark it as "good detection"
+            operations[ind, 1] = 1
+            # and ensure the other options aren't selected
+            operations[ind, 2:] = 0
+            detections_accounted_for[ind] = 1
+            annotations_accounted_for[i] += 1
+        else:  # The detection is outside of a tolerance window
+            # Mark it for possible shifting or deletion, but only if
+            # it hasn't already been marked as "good" for another detection
+            if detections_accounted_for[ind] == 0:
+                operations[ind, 3:] = 1
+
+    # (2) extra detections (unmarked by now) are marked for deletion or shifting
+    operations[np.nonzero(operations[:, 1:].sum(axis=1) == 0), 3:] = 1
+
+    # (3) Determine which shifts and qualify the shift
+    for i, ann in enumerate(annotations):
+        # look at the unaccounted for annotations
+        if (annotations_accounted_for[i] == 0):
+            out_tol_win_min = ann - out_tol_win
+            out_tol_win_max = ann + out_tol_win
+            # get the set of detections inside the window
+            dets_idx_in_shift_window, = np.nonzero((detections >= out_tol_win_min) & (detections <= out_tol_win_max))
+            # over this set, we remove any detection that is
+            # already accounted as a good detection
+            # FIXME: Vectorised
+            idx_to_remove = []
+            for j, det in enumerate(dets_idx_in_shift_window):
+                if (operations[det, 1] == 1) or (detections_accounted_for[det] == 1):
+                    idx_to_remove.append(j)
+            # Clear marking for removals
+            dets_idx_in_shift_window = np.delete(dets_idx_in_shift_window, idx_to_remove)
+            # find whichever unaccounted for detections is closest and mark this is a shift
+            # FIXME: count_shift_to_treat
+            count_shift_to_treat = len(dets_idx_in_shift_window)
+            if count_shift_to_treat > 0:
+                # Which is the closest detection the the current annotation ann
+                dist = [ann - detections[det_idx] for det_idx in dets_idx_in_shift_window]
+                idx_closest = np.argmin(np.abs(dist))
+                if not detections_accounted_for[dets_idx_in_shift_window[idx_closest]]:
+                    # it's not a deletion
+                    operations[dets_idx_in_shift_window[idx_closest], 3] = 0
+                    # we explicitly mark the shift
+                    operations[dets_idx_in_shift_window[idx_closest], 4] = dist[idx_closest]
+
+                # Once it's a shift, mark it as accounted for
+                annotations_accounted_for[i] += 1
+                detections_accounted_for[dets_idx_in_shift_window[idx_closest]] += 1
+                count_shift_to_treat -= 1
+
+            # Mark for deletion any other candidates for shift
+            if count_shift_to_treat > 0:
+                idx, = np.where(detections_accounted_for[dets_idx_in_shift_window] == 0)
+                operations[dets_idx_in_shift_window[idx], 3] = 1  # mark as deletion
+                operations[dets_idx_in_shift_window[idx], 4] = 0  # reset the shift to 0
+
+    # (4) any detections marked as deletions and shifts, are now definitely deletions
+    operations[np.nonzero(operations[:, 3:].sum(axis=1) == 2), 4] = 0
+
+    # (5) Unnacounted annotations become insertions
+    for i, ann in enumerate(annotations):
+        if annotations_accounted_for[i] == 0:
+            new_row = np.array([ann, 0., 1., 0., 0.])
+            operations = np.vstack((operations, new_row))
+
+    # Error checking
+    if double_check_accounted(detections_accounted_for, annotations_accounted_for):
+        print('ERROR')
+
+    ae = annotation_efficiency(operations)
+
+    return operations, ae
+
+
+# Straightforward (O(N*M)) versions of the metrics of the metric registry (see ext_libraries),
+# which has no original implementation to freeze
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def _closest(values, targets):
+    """Index of the closest value to each target (the first one on ties), from all the distances."""
+    return np.argmin(np.abs(values[np.newaxis, :] - targets[:, np.newaxis]), axis=1)
+
+
+def _intervals(beats):
+    """Interval to the previous beat (to the next one for the first beat)."""
+    return np.array([beats[max(i, 1)] - beats[max(i, 1) - 1] for i in range(len(beats))])
+
+
+def _cml(detections, annotations, phase_tolerance, tempo_tolerance):
+    """CMLc and CMLt of the detections against a (variation of the) annotations."""
+    if len(annotations) < 2:
+        return 0.0, 0.0
+
+    closest = _closest(annotations, detections)
+    ann_intervals = _intervals(annotations)[closest]
+    det_intervals = _intervals(detections)
+
+    longest = run = total = 0
+    for i, detection in enumerate(detections):
+        phase_correct = abs(detection - annotations[closest[i]]) <= phase_tolerance * ann_intervals[i]
+        tempo_correct = abs(det_intervals[i] - ann_intervals[i]) <= tempo_tolerance * ann_intervals[i]
+        correct = bool(phase_correct and tempo_correct)
+        run = run + 1 if correct else 0
+        longest = max(longest, run)
+        total += correct
+
+    n_beats = max(len(detections), len(annotations))
+    return longest / n_beats, total / n_beats
+
+
+def continuity(annotations, detections, phase_tolerance=0.175, tempo_tolerance=0.175):
+    """CMLc, CMLt, AMLc and AMLt (the best of the variations of the annotations)."""
+    annotations = np.sort(np.asarray(annotations, dtype=float))
+    detections = np.sort(np.asarray(detections, dtype=float))
+    if len(detections) == 0 and len(annotations) == 0:
+        return 1.0, 1.0, 1.0, 1.0
+    if len(detections) < 2 or len(annotations) < 2:
+        return 0.0, 0.0, 0.0, 0.0
+
+    sequences, _ = variations(annotations)
+    scores = [_cml(detections, np.asarray(sequence, dtype=float), phase_tolerance, tempo_tolerance)
+              for sequence in sequences if len(sequence) > 0]
+    cmlc, cmlt = scores[0]
+    return cmlc, cmlt, max(c for c, _ in scores), max(t for _, t in scores)
+
+
+def p_score(annotations, detections, tolerance=0.2):
+    """P-score: pairs closer than tolerance times the median inter-annotation interval."""
+    annotations = np.sort(np.asarray(annotations, dtype=float))
+    detections = np.sort(np.asarray(detections, dtype=float))
+    if len(detections) == 0 and len(annotations) == 0:
+        return 1.0
+    if len(detections) == 0 or len(annotations) < 2:
+        return 0.0
+
+    window = tolerance * np.median(np.diff(annotations))
+    pairs = sum(int(np.sum((detections >= annotation - window) & (detections <= annotation + window)))
+                for annotation in annotations)
+    return pairs / max(len(detections), len(annotations))
+
+
+def cemgil(annotations, detections, sigma=0.04):
+    """Cemgil accuracy: Gaussian error of the closest detection (with the 1e-7 offset) to each annotation."""
+    annotations = np.sort(np.asarray(annotations, dtype=float))
+    detections = np.sort(np.asarray(detections, dtype=float))
+    if len(detections) == 0 and len(annotations) == 0:
+        return 1.0
+    if len(detections) == 0 or len(annotations) == 0:
+        return 0.0
+
+    errors = detections[_closest(detections + 1e-7, annotations)] - annotations
+    return float(np.sum(np.exp(-errors ** 2 / (2 * sigma ** 2)))) / (0.5 * (len(detections) + len(annotations)))
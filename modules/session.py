@@ -0,0 +1,293 @@
+"""
+This module contains the interactive correction session.
+It keeps the operations state of a track, so that single beat edits only
+recompute (and redraw) the affected neighbourhood.
+
+"""
+import numpy as np
+
+from modules.operating import TIE_OFFSET, annotation_efficiency
+
+
+class CorrectionSession:
+    """
+    Editable operations state of a track (detections vs. annotations).
+
+    Detections can be inserted, deleted or moved one at a time. Each edit only
+    recomputes the annotations whose tolerance windows reach the edited beat
+    (and the ones the greedy shift matching propagates to), and gives the same
+    operations as a full call to operation_count.
+
+    Parameters
+    ----------
+    detections : list/nparray
+        beat detections.
+    annotations : list/nparray
+        ground-truth annotations.
+    inn_tol_win : float
+        inner tolerance window in seconds
+        (default value=0.07)
+    out_tol_win : float
+        outer tolerance window in seconds
+        (default value=1)
+    """
+
+    def __init__(self, detections, annotations, inn_tol_win=0.07, out_tol_win=1.0):
+        self.detections = np.sort(np.asarray(detections, dtype=float)) + TIE_OFFSET
+        self.annotations = np.sort(np.asarray(annotations, dtype=float))
+        self.inn_tol_win = inn_tol_win
+        self.out_tol_win = out_tol_win
+
+        # per annotation: index of its "good" detection / of its shifted detection (-1 if none)
+        self._good_of = np.full(len(self.annotations), -1)
+        self._shift_of = np.full(len(self.annotations), -1)
+        # per detection: number of annotations marking it as "good" / annotation it is shifted to (-1 if none)
+        self._good_count = np.zeros(len(self.detections), dtype=int)
+        self._owner = np.full(len(self.detections), -1)
+
+        self._match_good(0, len(self.annotations))
+        self._match_shifts(0, len(self.annotations))
+
+        self.view = None
+
+    @property
+    def operations(self):
+        """Matrix of operations (same layout as returned by operation_count)."""
+        return self._rows(slice(None), slice(None))
+
+    def operations_between(self, start, end):
+        """
+        Rows of the operations matrix with a time inside [start, end] (in O(log N) plus the number of rows).
+
+        Returns
+        -------
+        operations: nparray
+            the detections inside the interval, followed by its insertions.
+        """
+        det_first = np.searchsorted(self.detections, start, 'left')
+        det_last = np.searchsorted(self.detections, end, 'right')
+        ann_first = np.searchsorted(self.annotations, start, 'left')
+        ann_last = np.searchsorted(self.annotations, end, 'right')
+        return self._rows(slice(det_first, det_last), slice(ann_first, ann_last))
+
+    def _rows(self, detections_slice, annotations_slice):
+        """Rows of the operations matrix of a slice of the detections and a slice of the annotations."""
+        detections = self.detections[detections_slice]
+        operations = np.zeros(shape=(len(detections), 5))
+        operations[:, 0] = detections
+
+        good = self._good_count[detections_slice] > 0
+        operations[good, 1] = 1
+        operations[~good, 3] = 1
+
+        owner = self._owner[detections_slice]
+        shifted, = np.nonzero(owner >= 0)
+        operations[shifted, 3] = 0
+        operations[shifted, 4] = self.annotations[owner[shifted]] - detections[shifted]
+        # any detections marked as deletions and shifts, are definitely deletions
+        operations[np.nonzero(operations[:, 3:].sum(axis=1) == 2), 4] = 0
+
+        # unaccounted annotations become insertions
+        unaccounted = (self._good_of[annotations_slice] < 0) & (self._shift_of[annotations_slice] < 0)
+        insertions = self.annotations[annotations_slice][unaccounted]
+        new_rows = np.zeros(shape=(len(insertions), 5))
+        new_rows[:, 0] = insertions
+        new_rows[:, 2] = 1
+
+        return np.vstack((operations, new_rows))
+
+    def annotation_efficiency(self):
+        """Annotation efficiency and stats of the current operations (see annotation_efficiency)."""
+        return annotation_efficiency(self.operations)
+
+    def insert_beat(self, time):
+        """
+        Inserts a detection.
+
+        Parameters
+        ----------
+        time : float
+            position of the new detection in seconds.
+
+        Returns
+        -------
+        changed: tuple
+            (start, end) time interval where the operations may have changed.
+        """
+        return self._update([self._insert(time)])
+
+    def delete_beat(self, idx):
+        """
+        Deletes a detection.
+
+        Parameters
+        ----------
+        idx : int
+            row of the detection in the operations matrix.
+
+        Returns
+        -------
+        changed: tuple
+            (start, end) time interval where the operations may have changed.
+        """
+        return self._update([self._delete(idx)])
+
+    def move_beat(self, idx, time):
+        """
+        Moves a detection (e.g. applies a suggested shift).
+
+        Parameters
+        ----------
+        idx : int
+            row of the detection in the operations matrix.
+        time : float
+            new position of the detection in seconds.
+
+        Returns
+        -------
+        changed: tuple
+            (start, end) time interval where the operations may have changed.
+        """
+        return self._update([self._delete(idx), self._insert(time)])
+
+    def plot(self, title='', plot_type='subplots'):
+        """
+        Produces the operations figure (see plot_operations), which is then updated in place after each edit.
+
+        Returns
+        -------
+        fig: matplotlib figure
+        ax: matplotlib axis
+        """
+        from modules.plotting import OperationsView
+
+        self.view = OperationsView(self.operations, self.annotations, title, self.inn_tol_win, self.out_tol_win,
+                                   plot_type)
+        return self.view.fig, self.view.ax
+
+    def _insert(self, time):
+        """Inserts a detection in the state (without recomputing the operations) and returns it."""
+        detection = time + TIE_OFFSET
+        idx = np.searchsorted(self.detections, detection)
+
+        self.detections = np.insert(self.detections, idx, detection)
+        self._good_count = np.insert(self._good_count, idx, 0)
+        self._owner = np.insert(self._owner, idx, -1)
+        self._good_of[self._good_of >= idx] += 1
+        self._shift_of[self._shift_of >= idx] += 1
+
+        return detection
+
+    def _delete(self, idx):
+        """Deletes a detection from the state (without recomputing the operations) and returns it."""
+        detection = self.detections[idx]
+
+        self.detections = np.delete(self.detections, idx)
+        self._good_count = np.delete(self._good_count, idx)
+        self._owner = np.delete(self._owner, idx)
+        self._good_of[self._good_of == idx] = -1
+        self._good_of[self._good_of > idx] -= 1
+        # -2: the shifted detection no longer exists (the annotation is recomputed by _update)
+        self._shift_of[self._shift_of == idx] = -2
+        self._shift_of[self._shift_of > idx] -= 1
+
+        return detection
+
+    def _update(self, edited):
+        """
+        Recomputes the operations around the edited detections, updates the figure (if any)
+        and returns the changed time interval.
+        """
+        annotations = self.annotations
+        edited = sorted(edited)
+
+        # (1) only annotations close to the edited detections may have a different "good" detection,
+        # and only detections close to these annotations may have changed their status
+        for detection in edited:
+            self._match_good(np.searchsorted(annotations, detection - 2 * self.inn_tol_win, 'left'),
+                             np.searchsorted(annotations, detection + 2 * self.inn_tol_win, 'right'))
+        margin = 4 * self.inn_tol_win + TIE_OFFSET
+        start, end = edited[0] - margin, edited[-1] + margin
+
+        # (3) shifts of the annotations whose outer tolerance window reaches the changed detections
+        # (in annotation order: each recomputation starts from annotations that are up to date)
+        for detection in edited:
+            k_first = np.searchsorted(annotations, detection - margin - self.out_tol_win, 'left')
+            k_last = np.searchsorted(annotations, detection + margin + self.out_tol_win, 'right')
+            k_stop = self._match_shifts(k_first, k_last)
+            if k_stop > k_first:
+                start = min(start, annotations[k_first] - self.out_tol_win)
+                end = max(end, annotations[k_stop - 1] + self.out_tol_win)
+
+        if self.view is not None:
+            self.view.update(self.operations_between(*self.view.interval(start, end)), start, end)
+
+        return start, end
+
+    def _closest_good(self, ann):
+        """Index of the closest detection to ann if it's inside the inner tolerance window (-1 otherwise)."""
+        detections = self.detections
+        # any detection tied with the closest one is inside the window, so look only around it
+        lo = np.searchsorted(detections, ann - 2 * self.inn_tol_win, 'left')
+        hi = np.searchsorted(detections, ann + 2 * self.inn_tol_win, 'right')
+        if lo == hi:
+            return -1
+
+        dist = np.abs(detections[lo:hi] - ann)
+        ind = np.argmin(dist)
+        if dist[ind] <= self.inn_tol_win:
+            return lo + ind
+        return -1
+
+    def _match_good(self, k_first, k_last):
+        """(1) Marks the closest detection of annotations [k_first, k_last) as "good", if inside the window."""
+        for k in range(k_first, k_last):
+            old = self._good_of[k]
+            new = self._closest_good(self.annotations[k])
+            if old >= 0:
+                self._good_count[old] -= 1
+            if new >= 0:
+                self._good_count[new] += 1
+            self._good_of[k] = new
+
+    def _match_shifts(self, k_first, k_last):
+        """
+        (3) Redoes the greedy shift matching from annotation k_first onwards (in annotation order).
+        Once past k_last, it stops as soon as no detection with a changed shift is visible to the
+        remaining annotations, as their (previous) shifts can no longer change.
+        Returns the index of the first annotation that wasn't recomputed.
+        """
+        detections = self.detections
+        annotations = self.annotations
+        released = set()  # detections shifted before the edit (by the recomputed annotations)
+        claimed = set()   # detections shifted after the edit (by the recomputed annotations)
+
+        k = k_first
+        while k < len(annotations):
+            if k >= k_last:
+                if all(detections[det] < annotations[k] - self.out_tol_win for det in released ^ claimed):
+                    break
+
+            old = self._shift_of[k]
+            new = -1
+            if self._good_of[k] < 0:
+                lo = np.searchsorted(detections, annotations[k] - self.out_tol_win, 'left')
+                hi = np.searchsorted(detections, annotations[k] + self.out_tol_win, 'right')
+                # detections already accounted for (as good, or shifted to a previous annotation) are discarded
+                owner = self._owner[lo:hi]
+                candidates = np.arange(lo, hi)[(self._good_count[lo:hi] == 0) & ((owner < 0) | (owner >= k))]
+                if candidates.size > 0:
+                    dist = annotations[k] - detections[candidates]
+                    new = candidates[np.argmin(np.abs(dist))]
+
+            if old >= 0:
+                if self._owner[old] == k:
+                    self._owner[old] = -1
+                released.add(old)
+            if new >= 0:
+                self._owner[new] = k
+                claimed.add(new)
+            self._shift_of[k] = new
+            k += 1
+
+        return k